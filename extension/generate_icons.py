@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """
 Gera ícones PNG para a extensão do navegador.
-Requer: pip install Pillow
+Requer: pip install -r requirements.txt (pillow-simd)
+
+pillow-simd é um substituto direto do Pillow compilado com SSE4/AVX2; a API
+usada aqui (Image.new, ImageDraw.ellipse/line/polygon) é idêntica. Em
+plataformas sem build SIMD, `pip install Pillow` funciona sem alterações.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw
 import os
 
@@ -14,6 +19,9 @@ os.makedirs(ICONS_DIR, exist_ok=True)
 # Tamanhos dos ícones
 SIZES = [16, 32, 48, 128]
 
+# Tamanho da imagem mestre, desenhada uma única vez e reduzida para cada tamanho
+MASTER_SIZE = 512
+
 # Cores
 BG_COLOR = (102, 126, 234)  # #667eea
 ARROW_COLOR = (255, 255, 255)
@@ -67,14 +75,25 @@ def create_icon(size):
 
     return img
 
+def _render_one(master, size):
+    """Reduz a imagem mestre para o tamanho dado e salva o PNG."""
+    icon = master.resize((size, size), Image.LANCZOS)
+    filename = f'icon{size}.png'
+    # Compressão mínima: ícones pequenos, ganho de tamanho desprezível
+    icon.save(os.path.join(ICONS_DIR, filename), 'PNG', compress_level=1, optimize=False)
+    return filename
+
 def main():
     print("Gerando ícones da extensão...")
 
-    for size in SIZES:
-        icon = create_icon(size)
-        filepath = os.path.join(ICONS_DIR, f'icon{size}.png')
-        icon.save(filepath, 'PNG')
-        print(f"  Criado: icon{size}.png")
+    # Desenha uma vez em alta resolução e reduz com LANCZOS para cada tamanho
+    master = create_icon(MASTER_SIZE)
+
+    # O Pillow libera a GIL no resize/encode, então os tamanhos rodam em paralelo.
+    # map() preserva a ordem, então as mensagens saem na ordem de SIZES.
+    with ThreadPoolExecutor(max_workers=len(SIZES)) as executor:
+        for filename in executor.map(lambda size: _render_one(master, size), SIZES):
+            print(f"  Criado: {filename}")
 
     print(f"\nÍcones salvos em: {ICONS_DIR}")
     print("Extensão pronta para ser carregada no navegador!")
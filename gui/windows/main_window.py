@@ -2,50 +2,198 @@
 Janela principal do Video Downloader GUI
 """
 
+import json
+import socket
+import threading
 import requests
-from typing import Optional
+from queue import Queue
+from typing import Callable, Optional
+from requests.adapters import HTTPAdapter
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem,
     QHeaderView, QProgressBar, QComboBox, QSystemTrayIcon,
     QMenu, QMessageBox, QFrame, QSplitter, QGroupBox
 )
-from PySide6.QtCore import Qt, QTimer, Signal, QThread, QSize
-from PySide6.QtGui import QIcon, QAction, QColor, QFont, QPixmap, QPainter, QBrush
+from PySide6.QtCore import Qt, QTimer, Signal, Slot, QThread, QSize, QPoint
+from PySide6.QtGui import QIcon, QAction, QColor, QFont, QPixmap, QPainter, QBrush, QPolygon
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson é opcional
+    _json_loads = json.loads
 
 
 SERVER_URL = "http://127.0.0.1:5050"
 
+# Texto exibido para cada status (as cores ficam em QLabel#dlStatus[status=...])
+_STATUS_TEXTS = {
+    "queued": "Na fila",
+    "downloading": "Baixando...",
+    "processing": "Processando...",
+    "completed": "Concluído",
+    "failed": "Falhou",
+    "cancelled": "Cancelado",
+}
+_FINISHED_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# Ícone do tray, desenhado uma única vez (precisa de QApplication, por isso é lazy)
+_TRAY_PIXMAP: Optional[QPixmap] = None
+_TRAY_ICON: Optional[QIcon] = None
+
+
+def _get_tray_pixmap() -> QPixmap:
+    """Retorna o pixmap do tray, desenhando-o na primeira chamada."""
+    global _TRAY_PIXMAP
+    if _TRAY_PIXMAP is None:
+        pixmap = QPixmap(32, 32)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setBrush(QBrush(QColor("#667eea")))
+        painter.setPen(Qt.NoPen)
+        painter.drawEllipse(2, 2, 28, 28)
+        painter.setBrush(QBrush(QColor("white")))
+        # Seta de download simplificada
+        painter.drawRect(14, 8, 4, 10)
+        points = [(10, 16), (22, 16), (16, 24)]
+        painter.drawPolygon(QPolygon([QPoint(x, y) for x, y in points]))
+        painter.end()
+        _TRAY_PIXMAP = pixmap
+    return _TRAY_PIXMAP
+
+
+def _get_tray_icon() -> QIcon:
+    """Retorna o QIcon do tray em cache."""
+    global _TRAY_ICON
+    if _TRAY_ICON is None:
+        _TRAY_ICON = QIcon(_get_tray_pixmap())
+    return _TRAY_ICON
+
 
-class ApiWorker(QThread):
-    """Worker thread para chamadas de API sem bloquear a UI."""
+class ApiDispatcher(QThread):
+    """Thread única e persistente que executa as chamadas de API em fila.
 
-    finished = Signal(dict)
-    error = Signal(str)
+    Reutiliza uma única requests.Session (conexões keep-alive) em vez de criar
+    uma thread e uma conexão TCP nova a cada chamada.
+    """
 
-    def __init__(self, endpoint: str, method: str = "GET", data: dict = None):
+    # (callback, resultado) - entregue na thread da UI via conexão enfileirada
+    _result = Signal(object, object)
+
+    def __init__(self):
         super().__init__()
-        self.endpoint = endpoint
-        self.method = method
-        self.data = data
+        self.queue = Queue()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self._result.connect(self._deliver)
+
+    def submit(self, endpoint: str, method: str = "GET", data: dict = None,
+               on_finished: Optional[Callable] = None, on_error: Optional[Callable] = None):
+        """Enfileira uma chamada de API; callbacks rodam na thread da UI."""
+        self.queue.put((endpoint, method, data, on_finished, on_error))
+
+    def stop(self):
+        """Encerra a thread após a chamada em andamento."""
+        self.queue.put(None)
+        self.wait()
 
     def run(self):
-        try:
-            url = f"{SERVER_URL}{self.endpoint}"
-            if self.method == "GET":
-                response = requests.get(url, timeout=5)
-            elif self.method == "POST":
-                response = requests.post(url, json=self.data, timeout=10)
-            else:
-                response = requests.request(self.method, url, json=self.data, timeout=10)
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            endpoint, method, data, on_finished, on_error = job
+            try:
+                url = f"{SERVER_URL}{endpoint}"
+                if method == "GET":
+                    response = self.session.get(url, timeout=5)
+                elif method == "POST":
+                    response = self.session.post(url, json=data, timeout=10)
+                else:
+                    response = self.session.request(method, url, json=data, timeout=10)
+
+                self._result.emit(on_finished, _json_loads(response.content))
+            except requests.exceptions.ConnectionError:
+                self._result.emit(on_error, "Servidor offline")
+            except requests.exceptions.Timeout:
+                self._result.emit(on_error, "Timeout na conexão")
+            except Exception as e:
+                self._result.emit(on_error, str(e))
+
+        self.session.close()
+
+    @Slot(object, object)
+    def _deliver(self, callback, payload):
+        if callback is not None:
+            callback(payload)
+
+
+class SseWorker(QThread):
+    """Escuta /api/events (server-sent events) e emite cada snapshot da fila."""
+
+    download_event = Signal(dict)
+
+    # Servidor manda heartbeat a cada 15s; sem nada em 30s a conexão caiu
+    READ_TIMEOUT = 30
+    RECONNECT_DELAY = 5
 
-            self.finished.emit(response.json())
-        except requests.exceptions.ConnectionError:
-            self.error.emit("Servidor offline")
-        except requests.exceptions.Timeout:
-            self.error.emit("Timeout na conexão")
-        except Exception as e:
-            self.error.emit(str(e))
+    def __init__(self):
+        super().__init__()
+        self._stopped = threading.Event()
+        self._response = None
+
+    # Quanto stop() espera a thread sair sozinha antes de forçar
+    STOP_TIMEOUT_MS = 3000
+
+    @staticmethod
+    def _shutdown_socket(response):
+        """Derruba o socket do stream: close() sozinho não acorda um read bloqueado."""
+        fp = getattr(response.raw, "_fp", None)  # http.client.HTTPResponse
+        sock = getattr(getattr(getattr(fp, "fp", None), "raw", None), "_sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """Fecha o stream e espera a thread terminar."""
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            self._shutdown_socket(response)
+            response.close()
+        if not self.wait(self.STOP_TIMEOUT_MS):
+            # Ainda presa (ex.: conectando); não deixa o QThread ser destruído rodando
+            self.terminate()
+            self.wait()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._response = requests.get(
+                    f"{SERVER_URL}/api/events",
+                    stream=True,
+                    timeout=(5, self.READ_TIMEOUT),
+                )
+                for line in self._response.iter_lines(decode_unicode=True):
+                    if self._stopped.is_set():
+                        break
+                    if line and line.startswith("data:"):
+                        self.download_event.emit(_json_loads(line[5:]))
+            except Exception:
+                pass  # Servidor offline ou conexão caiu; tenta de novo
+            finally:
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+
+            # Espera interrompível: stop() acorda a thread na hora
+            self._stopped.wait(self.RECONNECT_DELAY)
 
 
 class DownloadItemWidget(QWidget):
@@ -53,9 +201,28 @@ class DownloadItemWidget(QWidget):
 
     cancel_requested = Signal(str)
 
+    _TITLE_LIMIT = 50
+    _URL_LIMIT = 60
+
+    # Fonte do título compartilhada entre todos os itens (criada após o QApplication)
+    _TITLE_FONT: Optional[QFont] = None
+
+    @classmethod
+    def _title_font(cls) -> QFont:
+        if cls._TITLE_FONT is None:
+            cls._TITLE_FONT = QFont("", 12, QFont.Bold)
+        return cls._TITLE_FONT
+
+    @staticmethod
+    def _truncate(text: str, limit: int) -> str:
+        return text if len(text) <= limit else text[:limit] + "..."
+
     def __init__(self, download_id: str, title: str, url: str):
         super().__init__()
         self.download_id = download_id
+        # Último estado aplicado, para ignorar atualizações sem mudança
+        self._last_status = None
+        self._last_progress = (-1, "", "")
         self.setup_ui(title, url)
 
     def setup_ui(self, title: str, url: str):
@@ -63,52 +230,32 @@ class DownloadItemWidget(QWidget):
         layout.setContentsMargins(12, 12, 12, 12)
         layout.setSpacing(6)
 
-        # Estilo do widget container
-        self.setStyleSheet("""
-            DownloadItemWidget {
-                background: #ffffff;
-                border: 1px solid #e0e0e0;
-                border-radius: 8px;
-            }
-        """)
+        # Estilos ficam na folha global (MainWindow.apply_styles), por objectName
         self.setAutoFillBackground(True)
 
         # Linha superior: título e botão cancelar
         top_layout = QHBoxLayout()
 
-        self.title_label = QLabel(title[:50] + "..." if len(title) > 50 else title)
-        self.title_label.setFont(QFont("", 12, QFont.Bold))
-        self.title_label.setStyleSheet("color: #333; background: transparent;")
+        self.title_label = QLabel(self._truncate(title, self._TITLE_LIMIT))
+        self.title_label.setFont(self._title_font())
+        self.title_label.setObjectName("dlTitle")
         top_layout.addWidget(self.title_label, 1)
 
         self.status_label = QLabel("Aguardando...")
-        self.status_label.setStyleSheet("color: #666; background: transparent; font-size: 12px;")
+        self.status_label.setObjectName("dlStatus")
         top_layout.addWidget(self.status_label)
 
         self.cancel_btn = QPushButton("✕")
         self.cancel_btn.setFixedSize(24, 24)
-        self.cancel_btn.setStyleSheet("""
-            QPushButton {
-                background: #ff5252;
-                color: white;
-                border: none;
-                border-radius: 12px;
-                font-weight: bold;
-                font-size: 12px;
-            }
-            QPushButton:hover {
-                background: #ff1744;
-            }
-        """)
+        self.cancel_btn.setObjectName("dlCancel")
         self.cancel_btn.clicked.connect(lambda: self.cancel_requested.emit(self.download_id))
         top_layout.addWidget(self.cancel_btn)
 
         layout.addLayout(top_layout)
 
         # URL (truncada)
-        url_display = url[:60] + "..." if len(url) > 60 else url
-        self.url_label = QLabel(url_display)
-        self.url_label.setStyleSheet("color: #666; font-size: 11px; background: transparent;")
+        self.url_label = QLabel(self._truncate(url, self._URL_LIMIT))
+        self.url_label.setObjectName("dlUrl")
         self.url_label.setToolTip(url)
         layout.addWidget(self.url_label)
 
@@ -119,31 +266,21 @@ class DownloadItemWidget(QWidget):
         self.progress_bar.setTextVisible(True)
         self.progress_bar.setFormat("%p%")
         self.progress_bar.setFixedHeight(20)
-        self.progress_bar.setStyleSheet("""
-            QProgressBar {
-                border: none;
-                border-radius: 4px;
-                background: #e8e8e8;
-                text-align: center;
-                color: #333;
-                font-size: 11px;
-                font-weight: bold;
-            }
-            QProgressBar::chunk {
-                border-radius: 4px;
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                    stop:0 #667eea, stop:1 #764ba2);
-            }
-        """)
+        self.progress_bar.setObjectName("dlProgress")
         layout.addWidget(self.progress_bar)
 
         # Info adicional (velocidade, ETA)
         self.info_label = QLabel("")
-        self.info_label.setStyleSheet("color: #888; font-size: 11px; background: transparent;")
+        self.info_label.setObjectName("dlInfo")
         layout.addWidget(self.info_label)
 
     def update_progress(self, percent: float, speed: str = "", eta: str = ""):
-        self.progress_bar.setValue(int(percent))
+        state = (int(percent), speed, eta)
+        if state == self._last_progress:
+            return
+        self._last_progress = state
+
+        self.progress_bar.setValue(state[0])
 
         info_parts = []
         if speed:
@@ -154,30 +291,19 @@ class DownloadItemWidget(QWidget):
         self.info_label.setText(" • ".join(info_parts))
 
     def set_status(self, status: str):
-        status_colors = {
-            "queued": ("#ff9800", "Na fila"),
-            "downloading": ("#2196f3", "Baixando..."),
-            "processing": ("#9c27b0", "Processando..."),
-            "completed": ("#4caf50", "Concluído"),
-            "failed": ("#f44336", "Falhou"),
-            "cancelled": ("#757575", "Cancelado")
-        }
+        if status == self._last_status:
+            return
+        self._last_status = status
 
-        color, text = status_colors.get(status, ("#666", status))
-        self.status_label.setText(text)
-        self.status_label.setStyleSheet(f"color: {color}; font-weight: bold; font-size: 12px; background: transparent;")
+        self.status_label.setText(_STATUS_TEXTS.get(status, status))
+        # A cor vem das regras QLabel#dlStatus[status="..."] da folha global
+        self.status_label.setProperty("status", status)
+        self.status_label.style().unpolish(self.status_label)
+        self.status_label.style().polish(self.status_label)
 
-        if status in ("completed", "failed", "cancelled"):
+        if status in _FINISHED_STATUSES:
+            # Estilo desabilitado vem de QPushButton#dlCancel:disabled
             self.cancel_btn.setEnabled(False)
-            self.cancel_btn.setStyleSheet("""
-                QPushButton {
-                    background: #ccc;
-                    color: white;
-                    border: none;
-                    border-radius: 12px;
-                    font-size: 12px;
-                }
-            """)
 
 
 class MainWindow(QMainWindow):
@@ -186,7 +312,8 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.download_widgets = {}
-        self.workers = []
+        self.dispatcher = ApiDispatcher()
+        self.dispatcher.start()
         self.setup_ui()
         self.setup_tray()
         self.setup_timers()
@@ -336,24 +463,8 @@ class MainWindow(QMainWindow):
 
     def setup_tray(self):
         """Configura o ícone na bandeja do sistema."""
-        # Cria ícone programaticamente
-        pixmap = QPixmap(32, 32)
-        pixmap.fill(Qt.transparent)
-        painter = QPainter(pixmap)
-        painter.setRenderHint(QPainter.Antialiasing)
-        painter.setBrush(QBrush(QColor("#667eea")))
-        painter.setPen(Qt.NoPen)
-        painter.drawEllipse(2, 2, 28, 28)
-        painter.setBrush(QBrush(QColor("white")))
-        # Seta de download simplificada
-        painter.drawRect(14, 8, 4, 10)
-        points = [(10, 16), (22, 16), (16, 24)]
-        from PySide6.QtGui import QPolygon
-        from PySide6.QtCore import QPoint
-        painter.drawPolygon(QPolygon([QPoint(x, y) for x, y in points]))
-        painter.end()
-
-        self.tray_icon = QSystemTrayIcon(QIcon(pixmap), self)
+        # Ícone desenhado programaticamente (em cache no módulo)
+        self.tray_icon = QSystemTrayIcon(_get_tray_icon(), self)
 
         # Menu do tray
         tray_menu = QMenu()
@@ -379,10 +490,15 @@ class MainWindow(QMainWindow):
         self.server_timer.timeout.connect(self.check_server_status)
         self.server_timer.start(5000)  # A cada 5 segundos
 
-        # Timer para atualizar lista de downloads
+        # Atualizações da lista chegam por server-sent events
+        self.sse_worker = SseWorker()
+        self.sse_worker.download_event.connect(self.on_downloads_received)
+        self.sse_worker.start()
+
+        # Heartbeat: recarrega a lista caso algum evento tenha se perdido
         self.downloads_timer = QTimer()
         self.downloads_timer.timeout.connect(self.refresh_downloads)
-        self.downloads_timer.start(2000)  # A cada 2 segundos
+        self.downloads_timer.start(30000)  # A cada 30 segundos
 
         # Verificação inicial
         self.check_server_status()
@@ -503,15 +619,85 @@ class MainWindow(QMainWindow):
             QScrollArea > QWidget > QWidget {
                 background: transparent;
             }
+
+            DownloadItemWidget {
+                background: #ffffff;
+                border: 1px solid #e0e0e0;
+                border-radius: 8px;
+            }
+
+            QLabel#dlTitle {
+                color: #333;
+                background: transparent;
+            }
+
+            QLabel#dlStatus {
+                color: #666;
+                background: transparent;
+                font-size: 12px;
+            }
+
+            QLabel#dlStatus[status="queued"] { color: #ff9800; font-weight: bold; }
+            QLabel#dlStatus[status="downloading"] { color: #2196f3; font-weight: bold; }
+            QLabel#dlStatus[status="processing"] { color: #9c27b0; font-weight: bold; }
+            QLabel#dlStatus[status="completed"] { color: #4caf50; font-weight: bold; }
+            QLabel#dlStatus[status="failed"] { color: #f44336; font-weight: bold; }
+            QLabel#dlStatus[status="cancelled"] { color: #757575; font-weight: bold; }
+
+            QLabel#dlUrl {
+                color: #666;
+                font-size: 11px;
+                background: transparent;
+            }
+
+            QLabel#dlInfo {
+                color: #888;
+                font-size: 11px;
+                background: transparent;
+            }
+
+            QPushButton#dlCancel {
+                background: #ff5252;
+                color: white;
+                border: none;
+                border-radius: 12px;
+                font-weight: bold;
+                font-size: 12px;
+            }
+
+            QPushButton#dlCancel:hover {
+                background: #ff1744;
+            }
+
+            QPushButton#dlCancel:disabled {
+                background: #ccc;
+                font-weight: normal;
+            }
+
+            QProgressBar#dlProgress {
+                border: none;
+                border-radius: 4px;
+                background: #e8e8e8;
+                text-align: center;
+                color: #333;
+                font-size: 11px;
+                font-weight: bold;
+            }
+
+            QProgressBar#dlProgress::chunk {
+                border-radius: 4px;
+                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
+                    stop:0 #667eea, stop:1 #764ba2);
+            }
         """)
 
     def check_server_status(self):
         """Verifica o status do servidor."""
-        worker = ApiWorker("/api/status")
-        worker.finished.connect(self.on_server_status)
-        worker.error.connect(self.on_server_error)
-        self.workers.append(worker)
-        worker.start()
+        self.dispatcher.submit(
+            "/api/status",
+            on_finished=self.on_server_status,
+            on_error=self.on_server_error,
+        )
 
     def on_server_status(self, data: dict):
         """Callback quando o servidor responde."""
@@ -556,11 +742,11 @@ class MainWindow(QMainWindow):
             "outputFormat": output_format,  # Formato de saída (mp4, mp3, etc)
         }
 
-        worker = ApiWorker("/api/download", "POST", data)
-        worker.finished.connect(self.on_download_added)
-        worker.error.connect(self.on_download_error)
-        self.workers.append(worker)
-        worker.start()
+        self.dispatcher.submit(
+            "/api/download", "POST", data,
+            on_finished=self.on_download_added,
+            on_error=self.on_download_error,
+        )
 
         self.url_input.clear()
         self.add_btn.setEnabled(False)
@@ -584,11 +770,8 @@ class MainWindow(QMainWindow):
 
     def refresh_downloads(self):
         """Atualiza a lista de downloads."""
-        worker = ApiWorker("/api/queue")
-        worker.finished.connect(self.on_downloads_received)
-        worker.error.connect(lambda e: None)  # Ignora erros silenciosamente
-        self.workers.append(worker)
-        worker.start()
+        # Erros são ignorados silenciosamente
+        self.dispatcher.submit("/api/queue", on_finished=self.on_downloads_received)
 
     def on_downloads_received(self, data: dict):
         """Callback com a lista de downloads."""
@@ -610,7 +793,11 @@ class MainWindow(QMainWindow):
             if dl_id in self.download_widgets:
                 # Atualiza widget existente
                 widget = self.download_widgets[dl_id]
-                widget.set_status(dl.get("status", "queued"))
+                status = dl.get("status", "queued")
+                # Itens finalizados não mudam mais: nada a redesenhar
+                if status in _FINISHED_STATUSES and widget._last_status == status:
+                    continue
+                widget.set_status(status)
                 widget.update_progress(
                     dl.get("progress", 0),
                     dl.get("speed", ""),
@@ -655,19 +842,16 @@ class MainWindow(QMainWindow):
 
     def cancel_download(self, download_id: str):
         """Cancela um download."""
-        worker = ApiWorker(f"/api/download/{download_id}/cancel", "POST")
-        worker.finished.connect(lambda d: self.refresh_downloads())
-        worker.error.connect(lambda e: QMessageBox.warning(self, "Erro", f"Erro ao cancelar: {e}"))
-        self.workers.append(worker)
-        worker.start()
+        self.dispatcher.submit(
+            f"/api/download/{download_id}/cancel", "POST",
+            on_finished=lambda d: self.refresh_downloads(),
+            on_error=lambda e: QMessageBox.warning(self, "Erro", f"Erro ao cancelar: {e}"),
+        )
 
     def clear_completed(self):
         """Remove downloads concluídos da lista."""
-        worker = ApiWorker("/api/clear", "POST")
-        worker.finished.connect(lambda d: self.refresh_downloads())
-        worker.error.connect(lambda e: None)  # Ignora erros
-        self.workers.append(worker)
-        worker.start()
+        # Erros são ignorados
+        self.dispatcher.submit("/api/clear", "POST", on_finished=lambda d: self.refresh_downloads())
 
     def show_notification(self, title: str, message: str):
         """Exibe notificação do sistema."""
@@ -699,10 +883,8 @@ class MainWindow(QMainWindow):
     def quit_app(self):
         """Fecha o aplicativo completamente."""
         self.tray_icon.hide()
-        # Para todos os workers
-        for worker in self.workers:
-            if worker.isRunning():
-                worker.quit()
-                worker.wait()
+        # Para as threads de API e de eventos
+        self.sse_worker.stop()
+        self.dispatcher.stop()
         from PySide6.QtWidgets import QApplication
         QApplication.quit()
@@ -8,16 +8,43 @@ import struct
 import sys
 import subprocess
 import os
+import select
 import signal
+import socket
 import time
 from pathlib import Path
 import logging
 
+# msgspec is optional: it encodes straight to bytes and is much faster than
+# the stdlib json, but the host must keep working on a bare Python install.
+try:
+    import msgspec
+    _encode = msgspec.json.Encoder().encode
+    _decode = msgspec.json.Decoder().decode
+except ImportError:
+    def _encode(message):
+        return json.dumps(message).encode('utf-8')
+    _decode = json.loads
+
+# Native messaging frame header: 32-bit length in native byte order
+_HEADER = struct.Struct('=I')
+
+# Server processes started by this host, keyed by PID (lets stop_server wait on them)
+_children = {}
+
+# Last PID read from PID_FILE, with the file's mtime when it was read
+_pid_cache = (None, None)
+
 # Path to the server
 SCRIPT_DIR = Path(__file__).parent.absolute()
 PROJECT_DIR = SCRIPT_DIR.parent
 SERVER_PATH = PROJECT_DIR / "server" / "app.py"
 PID_FILE = SCRIPT_DIR / "server.pid"
+
+# Must match HOST/PORT in server/config.py (not imported: it creates
+# directories and probes for ffmpeg at import time)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 5050
 LOG_FILE = SCRIPT_DIR / "native_host.log"
 
 # Configure logging
@@ -32,58 +59,186 @@ def get_message():
     raw_length = sys.stdin.buffer.read(4)
     if not raw_length:
         return None
-    message_length = struct.unpack('=I', raw_length)[0]
-    message = sys.stdin.buffer.read(message_length).decode('utf-8')
-    return json.loads(message)
+    message_length = _HEADER.unpack(raw_length)[0]
+    return _decode(sys.stdin.buffer.read(message_length))
+
+def send_messages(messages):
+    """Send one or more framed messages to stdout in a single write."""
+    frames = []
+    for message in messages:
+        encoded = _encode(message)
+        frames.append(_HEADER.pack(len(encoded)))
+        frames.append(encoded)
+    sys.stdout.buffer.write(b''.join(frames))
+    sys.stdout.buffer.flush()
 
 def send_message(message):
     """Send a message to stdout (Chrome extension)."""
-    encoded = json.dumps(message).encode('utf-8')
-    sys.stdout.buffer.write(struct.pack('=I', len(encoded)))
-    sys.stdout.buffer.write(encoded)
-    sys.stdout.buffer.flush()
+    send_messages([message])
+
+def message_pending():
+    """Check, without blocking, whether another message is waiting on stdin."""
+    if sys.platform == "win32":
+        return False  # select() only works on sockets on Windows
+    readable, _, _ = select.select([sys.stdin.buffer], [], [], 0)
+    return bool(readable)
+
+def is_server_process(pid):
+    """
+    Check that `pid` is alive and is still our Python server.
+
+    A bare os.kill(pid, 0) also succeeds when the PID was recycled by an
+    unrelated process (and on Windows it terminates the process instead).
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                return "python" in f.read()
+        except OSError:
+            return False
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = wintypes.DWORD()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)) \
+                    or exit_code.value != STILL_ACTIVE:
+                return False
+            image = ctypes.create_unicode_buffer(32768)
+            size = wintypes.DWORD(len(image))
+            if not kernel32.QueryFullProcessImageNameW(handle, 0, image, ctypes.byref(size)):
+                return False
+            return os.path.normcase(image.value) == os.path.normcase(sys.executable)
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)  # Check if process exists
+        return True
+    except OSError:
+        return False
+
+def read_pid_file():
+    """Read PID_FILE, reusing the cached PID while the file's mtime is unchanged."""
+    global _pid_cache
+    mtime = PID_FILE.stat().st_mtime_ns  # Raises FileNotFoundError if missing
+    if mtime == _pid_cache[0]:
+        return _pid_cache[1]
+    pid = int(PID_FILE.read_text().strip())
+    _pid_cache = (mtime, pid)
+    return pid
 
 def is_server_running():
     """Check if the Flask server is running."""
-    if PID_FILE.exists():
-        try:
-            pid = int(PID_FILE.read_text().strip())
-            os.kill(pid, 0)  # Check if process exists
-            return True, pid
-        except (OSError, ValueError):
-            PID_FILE.unlink(missing_ok=True)
+    try:
+        pid = read_pid_file()
+    except FileNotFoundError:
+        return False, None
+    except (OSError, ValueError):
+        pid = None
+    if pid is not None and is_server_process(pid):
+        return True, pid
+    PID_FILE.unlink(missing_ok=True)
     return False, None
 
+def _get_pid_by_port_linux(port):
+    """Find the PID listening on a TCP port via /proc (no subprocess)."""
+    # /proc/net/tcp[6] columns: sl local_address rem_address st ... inode
+    port_hex = f"{port:04X}"
+    targets = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)  # Header
+                for line in f:
+                    fields = line.split()
+                    if fields[3] == "0A" and fields[1].rsplit(":", 1)[1] == port_hex:  # 0A = LISTEN
+                        targets.add(f"socket:[{fields[9]}]")
+        except OSError:
+            continue
+    logging.debug(f"Listening socket inodes on port {port}: {targets}")
+    if not targets:
+        return None
+
+    # Map the socket inode back to its owner through the /proc/<pid>/fd symlinks
+    with os.scandir("/proc") as procs:
+        for proc in procs:
+            if not proc.name.isdigit():
+                continue
+            try:
+                with os.scandir(f"/proc/{proc.name}/fd") as fds:
+                    for fd in fds:
+                        try:
+                            if os.readlink(fd.path) in targets:
+                                return int(proc.name)
+                        except OSError:
+                            continue
+            except OSError:
+                continue  # Process exited or belongs to another user
+    return None
+
+def _get_pid_by_port_windows(port):
+    """Find the PID listening on a TCP port via GetExtendedTcpTable (no subprocess)."""
+    import ctypes
+    from ctypes import wintypes
+
+    AF_INET = 2
+    TCP_TABLE_OWNER_PID_LISTENER = 3
+    ERROR_INSUFFICIENT_BUFFER = 122
+
+    class MIB_TCPROW_OWNER_PID(ctypes.Structure):
+        _fields_ = [
+            ("dwState", wintypes.DWORD),
+            ("dwLocalAddr", wintypes.DWORD),
+            ("dwLocalPort", wintypes.DWORD),
+            ("dwRemoteAddr", wintypes.DWORD),
+            ("dwRemotePort", wintypes.DWORD),
+            ("dwOwningPid", wintypes.DWORD),
+        ]
+
+    get_table = ctypes.windll.iphlpapi.GetExtendedTcpTable
+    size = wintypes.DWORD(0)
+    buf = None
+    result = get_table(None, ctypes.byref(size), False, AF_INET, TCP_TABLE_OWNER_PID_LISTENER, 0)
+    # The table can grow between the size query and the real call
+    while result == ERROR_INSUFFICIENT_BUFFER:
+        buf = ctypes.create_string_buffer(size.value)
+        result = get_table(buf, ctypes.byref(size), False, AF_INET, TCP_TABLE_OWNER_PID_LISTENER, 0)
+    if result != 0 or buf is None:
+        logging.debug(f"GetExtendedTcpTable failed: {result}")
+        return None
+
+    count = wintypes.DWORD.from_buffer(buf).value
+    rows = (MIB_TCPROW_OWNER_PID * count).from_buffer(buf, ctypes.sizeof(wintypes.DWORD))
+    for row in rows:
+        if socket.ntohs(row.dwLocalPort & 0xFFFF) == port:
+            return row.dwOwningPid
+    return None
+
 def get_pid_by_port(port=5050):
     """Get the PID of the process using a specific port."""
     logging.debug(f"get_pid_by_port called for port {port}")
     try:
         if sys.platform == "win32":
-            # On Windows, use netstat to find the process
-            logging.debug("Running netstat...")
-            result = subprocess.run(
-                ["netstat", "-ano", "-p", "TCP"],
-                capture_output=True, text=True, check=False
-            )
-            logging.debug(f"netstat returncode: {result.returncode}")
-            for line in result.stdout.split('\n'):
-                if f":{port}" in line and "LISTENING" in line:
-                    parts = line.split()
-                    logging.debug(f"Found matching line: {line.strip()}")
-                    logging.debug(f"Parts: {parts}")
-                    if parts:
-                        pid = int(parts[-1])
-                        logging.debug(f"Found PID: {pid}")
-                        return pid
-            logging.debug(f"No process found on port {port}")
+            pid = _get_pid_by_port_windows(port)
+        elif sys.platform.startswith("linux"):
+            pid = _get_pid_by_port_linux(port)
         else:
-            # On Unix, use lsof
+            # On macOS, use lsof
             result = subprocess.run(
                 ["lsof", "-ti", f":{port}"],
                 capture_output=True, text=True, check=False
             )
-            if result.stdout.strip():
-                return int(result.stdout.strip().split('\n')[0])
+            pid = int(result.stdout.strip().split('\n')[0]) if result.stdout.strip() else None
+        logging.debug(f"Found PID: {pid}" if pid else f"No process found on port {port}")
+        return pid
     except Exception as e:
         logging.error(f"Error in get_pid_by_port: {e}")
     return None
@@ -114,12 +269,26 @@ def kill_process_by_port(port=5050):
             logging.error(f"Error killing process: {e}")
     return False, None
 
+def _port_accepts(timeout=0.05):
+    """Check whether something accepts TCP connections on the server port."""
+    with socket.socket() as sock:
+        sock.settimeout(timeout)
+        return sock.connect_ex((SERVER_HOST, SERVER_PORT)) == 0
+
+def _port_in_use_error(pid):
+    owner = f" by PID {pid}" if pid else ""
+    return {"success": False, "error": f"Port {SERVER_PORT} is already in use{owner}"}
+
 def start_server():
     """Start the Flask server."""
     running, pid = is_server_running()
     if running:
         return {"success": True, "message": "Server already running", "pid": pid}
 
+    # A stale or foreign listener would make the new server die with EADDRINUSE
+    if _port_accepts():
+        return _port_in_use_error(get_pid_by_port(SERVER_PORT))
+
     try:
         # Start server as subprocess
         process = subprocess.Popen(
@@ -132,19 +301,78 @@ def start_server():
 
         # Save PID
         PID_FILE.write_text(str(process.pid))
+        _children[process.pid] = process
 
-        # Wait briefly to ensure it started
-        time.sleep(1)
+        # Return as soon as our child is the one listening (up to 2 seconds)
+        listener = None
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and process.poll() is None:
+            if _port_accepts():
+                listener = get_pid_by_port(SERVER_PORT)
+                # None: owner not visible to us, but the port was free before the spawn
+                if listener in (None, process.pid):
+                    break
+            time.sleep(0.02)
 
-        # Verify it's running
-        if process.poll() is None:
+        # Verify it's running (still starting up after 2s counts as started)
+        if process.poll() is None and listener in (None, process.pid):
             return {"success": True, "message": "Server started", "pid": process.pid}
-        else:
-            PID_FILE.unlink(missing_ok=True)
-            return {"success": False, "error": "Server failed to start"}
+
+        # Died, or another process grabbed the port first
+        if process.poll() is None:
+            process.terminate()
+        PID_FILE.unlink(missing_ok=True)
+        _children.pop(process.pid, None)
+        if listener not in (None, process.pid):
+            return _port_in_use_error(listener)
+        return {"success": False, "error": "Server failed to start"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def wait_for_exit(pid, timeout):
+    """
+    Block until the process exits or `timeout` seconds pass.
+
+    Returns True if the process is gone. Uses a process handle (Windows) or a
+    pidfd (Linux 5.3+) so the kernel wakes us on exit instead of polling.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        SYNCHRONIZE = 0x00100000
+        WAIT_OBJECT_0 = 0
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+        if not handle:
+            return True  # Process already gone
+        try:
+            return kernel32.WaitForSingleObject(handle, int(timeout * 1000)) == WAIT_OBJECT_0
+        finally:
+            kernel32.CloseHandle(handle)
+
+    if hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # Kernel without pidfd support, fall back to polling
+        else:
+            try:
+                poller = select.poll()
+                poller.register(fd, select.POLLIN)
+                return bool(poller.poll(int(timeout * 1000)))
+            finally:
+                os.close(fd)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return True
+        time.sleep(0.5)
+    return False
+
 def stop_server():
     """Stop the Flask server."""
     logging.info("stop_server called")
@@ -154,7 +382,7 @@ def stop_server():
     # If PID file doesn't exist, try to find server by port
     if not running:
         logging.debug("PID file not found, trying to find server by port...")
-        killed, port_pid = kill_process_by_port(5050)
+        killed, port_pid = kill_process_by_port(SERVER_PORT)
         logging.debug(f"kill_process_by_port returned: killed={killed}, port_pid={port_pid}")
         if killed:
             PID_FILE.unlink(missing_ok=True)
@@ -163,6 +391,18 @@ def stop_server():
         logging.info("Server not running (no PID file and no process on port)")
         return {"success": True, "message": "Server not running"}
 
+    # If we started the server ourselves, wait on the Popen object
+    process = _children.pop(pid, None)
+
+    def exited(timeout):
+        if process is None:
+            return wait_for_exit(pid, timeout)
+        try:
+            process.wait(timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
     try:
         # Platform-specific process termination
         if sys.platform == "win32":
@@ -170,32 +410,21 @@ def stop_server():
             # /F = force, /T = tree (kill child processes too)
             subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
                           capture_output=True, check=False)
+        elif process is not None:
+            process.terminate()
         else:
             # On Unix, use SIGTERM
             os.kill(pid, signal.SIGTERM)
 
-        # Wait for process to terminate
-        for i in range(20):  # Wait up to 10 seconds
-            time.sleep(0.5)
-            try:
-                # Check if process still exists
-                if sys.platform == "win32":
-                    result = subprocess.run(["tasklist", "/FI", f"PID eq {pid}"],
-                                          capture_output=True, text=True)
-                    if str(pid) not in result.stdout:
-                        break  # Process terminated
-                else:
-                    os.kill(pid, 0)
-            except (OSError, subprocess.SubprocessError):
-                break  # Process terminated
-        else:
+        # Wait up to 10 seconds for the process to terminate
+        if not exited(10):
             # Force kill if still running after 10 seconds
             if sys.platform == "win32":
                 subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
                              capture_output=True, check=False)
             else:
                 os.kill(pid, signal.SIGKILL)
-            time.sleep(0.5)  # Give it a moment to die
+            exited(2)  # Give it a moment to die
 
         PID_FILE.unlink(missing_ok=True)
         return {"success": True, "message": "Server stopped"}
@@ -211,6 +440,18 @@ def get_status():
         "pid": pid
     }
 
+def handle_message(message):
+    """Dispatch a single extension message and return the response."""
+    action = message.get("action")
+
+    if action == "start":
+        return start_server()
+    elif action == "stop":
+        return stop_server()
+    elif action == "status":
+        return get_status()
+    return {"success": False, "error": f"Unknown action: {action}"}
+
 def main():
     """Main loop to handle messages from the extension."""
     while True:
@@ -218,18 +459,17 @@ def main():
         if message is None:
             break
 
-        action = message.get("action")
+        responses = [handle_message(message)]
+        # Answer every message that is already queued with a single write
+        while message_pending():
+            message = get_message()
+            if message is None:
+                break
+            responses.append(handle_message(message))
 
-        if action == "start":
-            response = start_server()
-        elif action == "stop":
-            response = stop_server()
-        elif action == "status":
-            response = get_status()
-        else:
-            response = {"success": False, "error": f"Unknown action: {action}"}
-
-        send_message(response)
+        send_messages(responses)
+        if message is None:
+            break
 
 if __name__ == "__main__":
     main()
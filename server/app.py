@@ -10,14 +10,28 @@ Endpoints:
     DELETE /api/download/<id>     - Remove completed download
     POST /api/clear               - Clear completed downloads
     POST /api/info                - Get video info without downloading
+    GET  /api/events              - Server-sent events with queue snapshots
 """
 import atexit
 import logging
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import subprocess
+import sys
+import threading
+import time
+from functools import cache
+from urllib.parse import urlparse
+from flask import Flask, Response, request
+import orjson
 
 import config
-from core import DownloadManager, AuthHandler, HublaExtractor, needs_special_extraction, transform_url_if_needed
+from core import (
+    Downloader,
+    AuthHandler,
+    HublaExtractor,
+    needs_special_extraction,
+    transform_url_if_needed,
+    manager,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -28,26 +42,82 @@ logger = logging.getLogger('video_downloader')
 
 app = Flask(__name__)
 
-# Configure CORS for extension
-CORS(app, origins=config.CORS_ORIGINS, supports_credentials=True)
 
-# Initialize managers
-download_manager = DownloadManager()
-auth_handler = AuthHandler()
+@app.before_request
+def short_circuit_preflight():
+    """Answer CORS preflight requests without routing them."""
+    if request.method == "OPTIONS":
+        return Response(status=204)
+
+
+@app.after_request
+def add_cors_headers(response):
+    """Allow the browser extension origins (plain prefix match, no regex)."""
+    origin = request.headers.get("Origin", "")
+    if origin.startswith(config.CORS_ORIGINS):
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        response.headers["Vary"] = "Origin"
+        if request.method == "OPTIONS":
+            response.headers["Access-Control-Allow-Methods"] = "GET, POST, DELETE, OPTIONS"
+            requested_headers = request.headers.get("Access-Control-Request-Headers")
+            if requested_headers:
+                response.headers["Access-Control-Allow-Headers"] = requested_headers
+    return response
+
+
+@cache
+def get_auth_handler() -> AuthHandler:
+    """Cookie handler, created on first use."""
+    return AuthHandler()
+
+
+# Output containers the extension may send as "format"; not yt-dlp selectors
+_CONTAINER_FORMATS = frozenset({"mp4", "webm", "mkv", "mp3", "m4a", "wav", "flac"})
+
+# Last serialized queue, keyed by DownloadManager.version
+_queue_cache = (None, b"")
+
+# One waitress thread is held per open /api/events stream
+_sse_slots = threading.BoundedSemaphore(config.SSE_MAX_CLIENTS)
+
+
+def ojsonify(obj) -> Response:
+    """Like flask.jsonify, but serialized with orjson."""
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+
+def _json_body():
+    """Parse the request body with orjson; None if it is missing or invalid."""
+    # Read the WSGI stream directly: no Werkzeug body buffer or form parsing
+    raw = request.stream.read(request.content_length or -1)
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _queue_snapshot() -> bytes:
+    """Return the queue JSON body, re-serializing only after changes."""
+    global _queue_cache
+    # Read the version before serializing so a concurrent change is never lost
+    version = manager.version
+    cached_version, body = _queue_cache
+    if cached_version != version:
+        body = manager.get_queue_bytes()
+        _queue_cache = (version, body)
+    return body
 
 
 @app.route("/api/status", methods=["GET"])
 def get_status():
     """Check if server is running."""
-    queue = download_manager.get_queue()
-    active = sum(1 for t in queue if t["status"] in ("downloading", "processing", "pending"))
-
-    return jsonify({
+    return ojsonify({
         "status": "running",
         "version": "1.0.0",
         "download_dir": str(config.DOWNLOAD_DIR),
-        "active_downloads": active,
-        "total_downloads": len(queue),
+        "active_downloads": manager.active_count,
+        "total_downloads": manager.task_count,
     })
 
 
@@ -65,10 +135,10 @@ def start_download():
             "videoUrl": "Optional extracted video URL (for Hub.la, etc)"
         }
     """
-    data = request.get_json()
+    data = _json_body()
 
     if not data or "url" not in data:
-        return jsonify({"error": "URL is required"}), 400
+        return ojsonify({"error": "URL is required"}), 400
 
     url = data["url"]
     title = data.get("title", "")
@@ -94,8 +164,7 @@ def start_download():
 
     # Don't use container formats (mp4, webm, etc) as format_id
     # These are output preferences, not yt-dlp format selectors
-    container_formats = {"mp4", "webm", "mkv", "mp3", "m4a", "wav", "flac"}
-    if format_id and format_id.lower() in container_formats:
+    if format_id and format_id.lower() in _CONTAINER_FORMATS:
         format_id = None
 
     # Transform URL if needed (Hub.la support)
@@ -105,7 +174,7 @@ def start_download():
     # Check if this is a course platform page URL without extracted video
     if needs_special_extraction(url) and not extracted_video_url:
         logger.warning(f"  Special extraction required but no video URL provided")
-        return jsonify({
+        return ojsonify({
             "error": "This course platform requires browser extraction",
             "extraction_required": True,
             "hint": "Please wait for the video to load and use the extension to detect the stream URL"
@@ -115,17 +184,16 @@ def start_download():
     cookie_file = None
     if cookies:
         try:
-            from urllib.parse import urlparse
             domain = urlparse(download_url).netloc
-            cookie_file = auth_handler.save_cookies_from_extension(cookies, domain)
+            cookie_file = get_auth_handler().save_cookies_from_extension(cookies, domain)
             logger.info(f"  Cookies saved to: {cookie_file}")
         except Exception as e:
             logger.error(f"  Failed to process cookies: {e}")
-            return jsonify({"error": f"Failed to process cookies: {e}"}), 400
+            return ojsonify({"error": f"Failed to process cookies: {e}"}), 400
 
     # Add to download queue
     logger.info(f"  Adding to download queue with audio_only={audio_only}")
-    task_id = download_manager.add_download(
+    task_id = manager.add_download(
         url=download_url,
         title=title,
         format_id=format_id,
@@ -134,7 +202,7 @@ def start_download():
     )
     logger.info(f"  Task created with ID: {task_id}")
 
-    return jsonify({
+    return ojsonify({
         "success": True,
         "id": task_id,
         "message": "Download started",
@@ -146,33 +214,70 @@ def start_download():
 @app.route("/api/download/<task_id>", methods=["GET"])
 def get_download(task_id):
     """Get status of a specific download."""
-    task = download_manager.get_task(task_id)
+    task = manager.get_task(task_id)
 
     if not task:
-        return jsonify({"error": "Download not found"}), 404
+        return ojsonify({"error": "Download not found"}), 404
 
-    return jsonify(task.to_dict())
+    return ojsonify(task.to_dict())
 
 
 @app.route("/api/queue", methods=["GET"])
 def get_queue():
     """Get all downloads in queue."""
-    queue = download_manager.get_queue()
-    return jsonify({
-        "downloads": queue,
-        "count": len(queue),
-    })
+    body = _queue_snapshot()
+    return Response(body, mimetype="application/json")
+
+
+@app.route("/api/events", methods=["GET"])
+def stream_events():
+    """
+    Stream queue snapshots as server-sent events.
+
+    Sends the full queue on connect and again whenever the queue changes
+    (coalesced to at most one event per SSE_MIN_INTERVAL). A comment line is
+    sent every SSE_HEARTBEAT_SECONDS while idle so clients can detect a dead
+    connection.
+
+    Each stream occupies a server thread, so at most SSE_MAX_CLIENTS are
+    served at once; extra clients get 503 and should retry later.
+    """
+    if not _sse_slots.acquire(blocking=False):
+        response = ojsonify({"error": "Too many event stream clients"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+
+    def generate():
+        while True:
+            # Read the version first so a change during the snapshot isn't missed
+            version = manager.version
+            payload = _queue_snapshot()
+            yield b"data: " + payload + b"\n\n"
+
+            while manager.wait_for_change(version, config.SSE_HEARTBEAT_SECONDS) == version:
+                yield b": heartbeat\n\n"
+            time.sleep(config.SSE_MIN_INTERVAL)
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(_sse_slots.release)
+    return response
 
 
 @app.route("/api/download/<task_id>/cancel", methods=["POST"])
 def cancel_download(task_id):
     """Cancel a download."""
-    success = download_manager.cancel_download(task_id)
+    success = manager.cancel_download(task_id)
 
     if not success:
-        return jsonify({"error": "Cannot cancel download"}), 400
+        return ojsonify({"error": "Cannot cancel download"}), 400
 
-    return jsonify({
+    return ojsonify({
         "id": task_id,
         "message": "Download cancelled",
     })
@@ -181,12 +286,12 @@ def cancel_download(task_id):
 @app.route("/api/download/<task_id>", methods=["DELETE"])
 def remove_download(task_id):
     """Remove a completed/cancelled download from the queue."""
-    success = download_manager.remove_task(task_id)
+    success = manager.remove_task(task_id)
 
     if not success:
-        return jsonify({"error": "Cannot remove active download"}), 400
+        return ojsonify({"error": "Cannot remove active download"}), 400
 
-    return jsonify({
+    return ojsonify({
         "id": task_id,
         "message": "Download removed",
     })
@@ -195,16 +300,13 @@ def remove_download(task_id):
 @app.route("/api/clear", methods=["POST"])
 def clear_completed():
     """Clear all completed/failed downloads from the queue."""
-    download_manager.clear_completed()
-    return jsonify({"success": True, "message": "Completed downloads cleared"})
+    manager.clear_completed()
+    return ojsonify({"success": True, "message": "Completed downloads cleared"})
 
 
 @app.route("/api/open-folder", methods=["POST"])
 def open_folder():
     """Open the downloads folder in the file manager."""
-    import subprocess
-    import sys
-
     folder_path = str(config.DOWNLOAD_DIR)
 
     try:
@@ -215,12 +317,12 @@ def open_folder():
         else:  # Linux
             subprocess.run(["xdg-open", folder_path], check=True)
 
-        return jsonify({
+        return ojsonify({
             "success": True,
             "path": folder_path
         })
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             "success": False,
             "error": str(e),
             "path": folder_path
@@ -238,10 +340,10 @@ def get_video_info():
             "cookies": [...]
         }
     """
-    data = request.get_json()
+    data = _json_body()
 
     if not data or "url" not in data:
-        return jsonify({"error": "URL is required"}), 400
+        return ojsonify({"error": "URL is required"}), 400
 
     url = data["url"]
     cookies = data.get("cookies", [])
@@ -249,20 +351,18 @@ def get_video_info():
     cookie_file = None
     if cookies:
         try:
-            from urllib.parse import urlparse
             domain = urlparse(url).netloc
-            cookie_file = auth_handler.save_cookies_from_extension(cookies, domain)
+            cookie_file = get_auth_handler().save_cookies_from_extension(cookies, domain)
         except Exception:
             pass
 
     try:
-        from core.downloader import Downloader
         downloader = Downloader(url=url, cookie_file=cookie_file)
         info = downloader.get_info()
 
         # Clean up cookie file
         if cookie_file:
-            auth_handler.cleanup_cookie_file(cookie_file)
+            get_auth_handler().cleanup_cookie_file(cookie_file)
 
         # Extract relevant info
         formats = []
@@ -276,7 +376,7 @@ def get_video_info():
                     "format_note": f.get("format_note", ""),
                 })
 
-        return jsonify({
+        return ojsonify({
             "title": info.get("title"),
             "duration": info.get("duration"),
             "thumbnail": info.get("thumbnail"),
@@ -287,14 +387,14 @@ def get_video_info():
 
     except Exception as e:
         if cookie_file:
-            auth_handler.cleanup_cookie_file(cookie_file)
-        return jsonify({"error": str(e)}), 400
+            get_auth_handler().cleanup_cookie_file(cookie_file)
+        return ojsonify({"error": str(e)}), 400
 
 
 def cleanup():
     """Cleanup on shutdown."""
-    download_manager.shutdown()
-    auth_handler.cleanup_old_cookies(max_age_hours=0)
+    manager.shutdown()
+    get_auth_handler().cleanup_old_cookies(max_age_hours=0)
 
 
 atexit.register(cleanup)
@@ -303,8 +403,13 @@ atexit.register(cleanup)
 if __name__ == "__main__":
     print(f"Starting Video Downloader Server on http://{config.HOST}:{config.PORT}")
     print(f"Downloads will be saved to: {config.DOWNLOAD_DIR}")
-    app.run(
-        host=config.HOST,
-        port=config.PORT,
-        debug=config.DEBUG,
-    )
+    if config.DEBUG:
+        # Werkzeug dev server (reloader, debugger) only for debugging
+        app.run(
+            host=config.HOST,
+            port=config.PORT,
+            debug=config.DEBUG,
+        )
+    else:
+        from waitress import serve
+        serve(app, host=config.HOST, port=config.PORT, threads=config.WORKERS)
@@ -8,6 +8,7 @@ from pathlib import Path
 HOST = "127.0.0.1"
 PORT = 5050
 DEBUG = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
+WORKERS = int(os.environ.get("WORKERS", 8))  # waitress request threads
 
 # Download settings
 DOWNLOAD_DIR = Path(os.environ.get(
@@ -18,6 +19,27 @@ DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Queue settings
 MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", 3))
+MAX_COMPLETED_HISTORY = 500  # Finished tasks kept in the queue before the oldest are dropped
+
+# ffmpeg MP3 encodes run at once across all downloads; lower it to keep encodes
+# from saturating the CPU (the rest wait for a slot). Stream-copy remuxes don't count.
+FFMPEG_WORKERS = int(os.environ.get("FFMPEG_WORKERS", MAX_CONCURRENT_DOWNLOADS))
+
+# Fragments (HLS/DASH segments) fetched in parallel within a single download
+CONCURRENT_FRAGMENT_DOWNLOADS = int(os.environ.get("CONCURRENT_FRAGMENT_DOWNLOADS", 8))
+
+# Parallel segment requests for the built-in HLS fetcher (core/hls_fetcher.py)
+HLS_CONCURRENCY = int(os.environ.get("HLS_CONCURRENCY", 32))
+
+# Largest buffer kept by the read-buffer pool (core/buffer_pool.py)
+CHUNK_SIZE = 2 * 1024 * 1024
+
+# Server-sent events (/api/events)
+# Each connected client holds one of the WORKERS threads for as long as it
+# stays connected; past this many, new streams get 503 so API calls still run
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", max(1, WORKERS // 2)))
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MIN_INTERVAL = 0.5  # Minimum seconds between queue snapshots
 
 # FFmpeg settings
 # Try environment variable first, then known locations
@@ -34,16 +56,26 @@ def _find_ffmpeg():
     import sys
     # On Windows, executables have .exe extension
     exe_suffix = ".exe" if sys.platform == "win32" else ""
+    wanted = {f"ffmpeg{exe_suffix}", f"ffprobe{exe_suffix}"}
 
     for path in _FFMPEG_DIRS:
         if not path:
             continue
-        # If path is a file, get its directory
-        if os.path.isfile(path):
+        # One directory listing per candidate instead of a stat per binary
+        try:
+            entries = os.scandir(path)
+        except NotADirectoryError:
+            # If path is a file, get its directory
             path = os.path.dirname(path)
-        ffmpeg = os.path.join(path, f"ffmpeg{exe_suffix}")
-        ffprobe = os.path.join(path, f"ffprobe{exe_suffix}")
-        if os.path.isfile(ffmpeg) and os.path.isfile(ffprobe):
+            try:
+                entries = os.scandir(path)
+            except OSError:
+                continue
+        except OSError:
+            continue
+        with entries:
+            found = {e.name for e in entries if e.name in wanted and e.is_file()}
+        if found == wanted:
             return path
     return None
 
@@ -81,11 +113,11 @@ else:
         "no_warnings": True,
     }
 
-# CORS settings - allow extension origin
-CORS_ORIGINS = [
-    "chrome-extension://*",
-    "moz-extension://*",
-]
+# CORS settings - allow extension origins (prefixes, matched with str.startswith)
+CORS_ORIGINS = (
+    "chrome-extension://",
+    "moz-extension://",
+)
 
 # Temporary cookie storage
 TEMP_COOKIE_DIR = Path("/tmp/video_downloader_cookies")
@@ -1,12 +1,13 @@
 """Core modules for video downloader server."""
 from .downloader import Downloader
-from .download_manager import DownloadManager
+from .download_manager import DownloadManager, manager
 from .auth_handler import AuthHandler
 from .extractors import HublaExtractor, get_extractor_for_url, needs_special_extraction, transform_url_if_needed
 
 __all__ = [
     "Downloader",
     "DownloadManager",
+    "manager",
     "AuthHandler",
     "HublaExtractor",
     "get_extractor_for_url",
@@ -0,0 +1,42 @@
+"""
+Reusable bytearray buffers for HTTP chunk reads.
+"""
+import threading
+
+import config
+
+
+class BufferPool:
+    """Free-list of bytearrays, handed out and returned instead of reallocated."""
+
+    def __init__(self, buffer_size: int, max_buffers: int):
+        self.buffer_size = buffer_size
+        self._max_buffers = max_buffers
+        self._free: list[bytearray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int = 0) -> bytearray:
+        """Take a pooled buffer of at least `size` bytes, or allocate one of exactly that size.
+
+        With size=0 (length unknown) any pooled buffer will do; a fresh one
+        starts empty and grows as it is written.
+        """
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if len(buf) >= size:
+                    return self._free.pop(i)
+        return bytearray(size)
+
+    def release(self, buf: bytearray):
+        """Return a buffer; oversized or surplus buffers are left to the GC."""
+        if len(buf) > self.buffer_size:
+            return
+        with self._lock:
+            if len(self._free) < self._max_buffers:
+                self._free.append(buf)
+
+
+# Caps what the pool pins for the server's lifetime (buffers of up to
+# CHUNK_SIZE each); segment reads beyond it allocate and are freed by the GC
+POOL_SIZE = 2 * config.MAX_CONCURRENT_DOWNLOADS
+POOL = BufferPool(config.CHUNK_SIZE, POOL_SIZE)
@@ -1,17 +1,48 @@
 """
 Download queue manager with threading support.
 """
+import itertools
+import operator
+import re
 import threading
-import uuid
-from queue import Queue
-from typing import Dict, Optional, Callable
-from dataclasses import dataclass, field
-from datetime import datetime
+import time
+from queue import Queue, SimpleQueue
+from typing import Dict, Iterator, Optional, Callable, Tuple
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
+import orjson
+
 import config
 from .downloader import Downloader, DownloadProgress, DownloadResult, DownloadStatus
 
+# Statuses counted as active downloads
+_ACTIVE_STATUSES = frozenset({
+    DownloadStatus.PENDING,
+    DownloadStatus.DOWNLOADING,
+    DownloadStatus.PROCESSING,
+})
+
+# Statuses of tasks that have finished (successfully or not)
+_FINISHED_STATUSES = (
+    DownloadStatus.COMPLETED,
+    DownloadStatus.ERROR,
+    DownloadStatus.CANCELLED,
+)
+
+# Number of independently locked task shards (must be a power of two)
+_SHARD_COUNT = 16
+
+# yt-dlp's per-format intermediate suffix, e.g. "Title.f137" in "Title.f137.mp4"
+_FORMAT_SUFFIX_RE = re.compile(r"\.f\d+$")
+
+
+def _title_from_filename(filename: str) -> str:
+    """Readable title from a yt-dlp output path (no directory, extension or format ID)."""
+    return _FORMAT_SUFFIX_RE.sub("", Path(filename).stem)
+
 
 @dataclass
 class DownloadTask:
@@ -22,51 +53,135 @@ class DownloadTask:
     cookie_file: Optional[str] = None
     audio_only: bool = False
     created_at: datetime = field(default_factory=datetime.now)
-    started_at: Optional[datetime] = None
-    completed_at: Optional[datetime] = None
+    # time.monotonic_ns() readings; 0 until set
+    created_ns: int = field(default_factory=time.monotonic_ns)
+    started_ns: int = 0
+    completed_ns: int = 0
     progress: DownloadProgress = field(default_factory=DownloadProgress)
     result: Optional[DownloadResult] = None
     downloader: Optional[Downloader] = None
+    # isoformat() strings, cached when the timestamps are set
+    _created_iso: str = field(init=False, repr=False)
+    _started_iso: Optional[str] = field(default=None, init=False, repr=False)
+    _completed_iso: Optional[str] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self._created_iso = self.created_at.isoformat()
+
+    def _wall_iso(self, ns: int) -> str:
+        """Wall-clock isoformat of a monotonic reading, anchored at created_at."""
+        return (self.created_at + timedelta(microseconds=(ns - self.created_ns) // 1000)).isoformat()
+
+    def mark_started(self):
+        """Record the start time."""
+        self.started_ns = time.monotonic_ns()
+        self._started_iso = self._wall_iso(self.started_ns)
+
+    def mark_completed(self):
+        """Record the completion time."""
+        self.completed_ns = time.monotonic_ns()
+        self._completed_iso = self._wall_iso(self.completed_ns)
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        """Seconds from start to completion, once finished."""
+        if not (self.started_ns and self.completed_ns):
+            return None
+        return (self.completed_ns - self.started_ns) / 1e9
 
     def to_dict(self) -> dict:
+        p = self.progress  # one consistent snapshot
         return {
             "id": self.id,
             "url": self.url,
-            "title": self.title,
-            "status": self.progress.status.value,
-            "progress": self.progress.progress,
-            "speed": self.progress.speed,
-            "eta": self.progress.eta,
-            "filename": self.progress.filename,
-            "error": self.progress.error,
-            "created_at": self.created_at.isoformat(),
-            "started_at": self.started_at.isoformat() if self.started_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "title": self.title or self.url,  # placeholder until yt-dlp reports one
+            "status": p.status.value,
+            "progress": p.progress,
+            "speed": p.speed,
+            "eta": p.eta,
+            "filename": p.filename,
+            "error": p.error,
+            "created_at": self._created_iso,
+            "started_at": self._started_iso,
+            "completed_at": self._completed_iso,
+            "elapsed": self.elapsed,
         }
 
 
 class DownloadManager:
     """Manages download queue with concurrent execution."""
 
-    _instance = None
-    _lock = threading.Lock()
-
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance._initialized = False
-        return cls._instance
-
     def __init__(self):
-        if self._initialized:
-            return
-
-        self._tasks: Dict[str, DownloadTask] = {}
+        self._shards: list[Tuple[threading.Lock, Dict[str, DownloadTask]]] = [
+            (threading.Lock(), {}) for _ in range(_SHARD_COUNT)
+        ]
         self._executor = ThreadPoolExecutor(max_workers=config.MAX_CONCURRENT_DOWNLOADS)
         self._progress_callbacks: list[Callable[[str, DownloadProgress], None]] = []
-        self._initialized = True
+        self._version = 0
+        # Guards _version; notified on every change so waiters (SSE streams) wake up
+        self._version_changed = threading.Condition()
+        self._active_ids: set[str] = set()
+        self._next_id = itertools.count(1)
+        # task_id -> (inputs to to_dict(), its result); reused while inputs are unchanged
+        self._dict_cache: dict[str, tuple[tuple, dict]] = {}
+        # Progress events are fanned out to callbacks off the download threads
+        self._events: SimpleQueue = SimpleQueue()
+        self._notify_thread = threading.Thread(
+            target=self._drain_notify, name="progress-notify", daemon=True
+        )
+        self._notify_thread.start()
+
+    @property
+    def version(self) -> int:
+        """Counter bumped on every queue state change (for caching snapshots)."""
+        return self._version
+
+    def _touch(self):
+        """Record a queue state change and wake anyone waiting for one."""
+        with self._version_changed:
+            self._version += 1
+            self._version_changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> int:
+        """Block until the version differs from `version` (or timeout); return the current one."""
+        with self._version_changed:
+            self._version_changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    @property
+    def active_count(self) -> int:
+        """Number of pending, downloading or processing tasks."""
+        return len(self._active_ids)
+
+    @property
+    def task_count(self) -> int:
+        """Number of tasks in the queue."""
+        return sum(len(tasks) for _, tasks in self._shards)
+
+    def _shard(self, task_id: str) -> Tuple[threading.Lock, Dict[str, DownloadTask]]:
+        """Return the (lock, tasks) shard owning a task ID."""
+        return self._shards[hash(task_id) & (_SHARD_COUNT - 1)]
+
+    def _iter_tasks(self) -> Iterator[DownloadTask]:
+        """Iterate over a snapshot of all tasks in insertion order.
+
+        Each shard is locked only while it is copied; the snapshot is then
+        sorted, so this is not lazy: all tasks are collected up front.
+        """
+        snapshot = []
+        for lock, tasks in self._shards:
+            with lock:
+                snapshot.extend(tasks.values())
+        # Shards are keyed by hash; IDs come from a counter, zero-padded so they sort
+        snapshot.sort(key=lambda task: task.id)
+        return iter(snapshot)
+
+    def _update_active(self, task_id: str, status: DownloadStatus):
+        """Keep the active set in sync with a task's status."""
+        if status in _ACTIVE_STATUSES:
+            self._active_ids.add(task_id)
+        else:
+            self._active_ids.discard(task_id)
 
     def add_progress_callback(self, callback: Callable[[str, DownloadProgress], None]):
         """Add a callback for progress updates."""
@@ -78,12 +193,23 @@ class DownloadManager:
             self._progress_callbacks.remove(callback)
 
     def _notify_progress(self, task_id: str, progress: DownloadProgress):
-        """Notify all callbacks of progress update."""
-        for callback in self._progress_callbacks:
-            try:
-                callback(task_id, progress)
-            except Exception:
-                pass
+        """Record a progress update and queue it for the callbacks."""
+        self._update_active(task_id, progress.status)
+        self._touch()
+        self._events.put_nowait((task_id, progress))
+
+    def _drain_notify(self):
+        """Notifier thread: deliver queued progress events to all callbacks."""
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            task_id, progress = event
+            for callback in self._progress_callbacks:
+                try:
+                    callback(task_id, progress)
+                except Exception:
+                    pass
 
     def add_download(
         self,
@@ -94,7 +220,7 @@ class DownloadManager:
         audio_only: bool = False,
     ) -> str:
         """Add a new download to the queue and start it."""
-        task_id = str(uuid.uuid4())[:8]
+        task_id = f"t{next(self._next_id):08x}"
 
         task = DownloadTask(
             id=task_id,
@@ -105,120 +231,179 @@ class DownloadManager:
             audio_only=audio_only,
         )
 
-        self._tasks[task_id] = task
+        lock, tasks = self._shard(task_id)
+        with lock:
+            tasks[task_id] = task
+        self._update_active(task_id, task.progress.status)
+        self._trim_history()
+        self._touch()
         self._executor.submit(self._execute_download, task_id)
 
         return task_id
 
+    def _trim_history(self):
+        """Drop the oldest finished tasks beyond config.MAX_COMPLETED_HISTORY."""
+        finished = [
+            task for task in self._iter_tasks()
+            if task.progress.status in _FINISHED_STATUSES
+        ]
+        excess = len(finished) - config.MAX_COMPLETED_HISTORY
+        if excess <= 0:
+            return
+
+        finished.sort(key=lambda task: task.completed_ns or task.created_ns)
+        for task in finished[:excess]:
+            lock, tasks = self._shard(task.id)
+            with lock:
+                tasks.pop(task.id, None)
+
     def _execute_download(self, task_id: str):
         """Execute a download task."""
         import logging
         logger = logging.getLogger('video_downloader.download_manager')
 
-        task = self._tasks.get(task_id)
+        task = self.get_task(task_id)
         if not task:
             return
 
         try:
-            task.started_at = datetime.now()
+            task.mark_started()
 
             downloader = Downloader(
                 url=task.url,
                 format_id=task.format_id,
                 cookie_file=task.cookie_file,
                 audio_only=task.audio_only,
+                title=task.title,
             )
             task.downloader = downloader
 
             def progress_callback(progress: DownloadProgress):
                 task.progress = progress
                 if not task.title and progress.filename:
-                    task.title = progress.filename
+                    task.title = _title_from_filename(progress.filename)
                 self._notify_progress(task_id, progress)
 
             downloader.set_progress_callback(progress_callback)
 
-            # Get video info first for title
-            try:
-                info = downloader.get_info()
-                task.title = info.get("title", task.url)
-            except Exception:
-                pass
-
+            # No separate get_info() round-trip: the title comes from the first
+            # progress filename and finally from the download result
             result = downloader.download()
             task.result = result
-            task.completed_at = datetime.now()
+            task.mark_completed()
+
+            # Pick up a final snapshot that never reached the callback
+            # (e.g. a cancel racing with yt-dlp's last hook)
+            if task.progress is not downloader.progress:
+                task.progress = downloader.progress
+                self._notify_progress(task_id, task.progress)
 
             if result.success and result.title:
                 task.title = result.title
+            self._touch()
         except Exception as e:
             logger.error(f"Uncaught exception in download task {task_id}: {e}", exc_info=True)
-            task.progress.status = DownloadStatus.ERROR
-            task.progress.error = str(e)
-            task.completed_at = datetime.now()
+            task.progress = replace(task.progress, status=DownloadStatus.ERROR, error=str(e))
+            task.mark_completed()
             self._notify_progress(task_id, task.progress)
+        finally:
+            # The downloader (yt-dlp options, hook closures) is only needed while running
+            task.downloader = None
 
     def get_task(self, task_id: str) -> Optional[DownloadTask]:
         """Get a task by ID."""
-        return self._tasks.get(task_id)
+        lock, tasks = self._shard(task_id)
+        with lock:
+            return tasks.get(task_id)
 
-    def get_all_tasks(self) -> list[DownloadTask]:
-        """Get all tasks."""
-        return list(self._tasks.values())
+    def get_all_tasks(self) -> Iterator[DownloadTask]:
+        """Iterate over a snapshot of all tasks, oldest first (later changes aren't seen)."""
+        return self._iter_tasks()
 
     def get_queue(self) -> list[dict]:
         """Get all tasks as dictionaries."""
-        return [task.to_dict() for task in self._tasks.values()]
+        old_cache = self._dict_cache
+        new_cache = {}
+        queue = []
+        for task in self._iter_tasks():
+            # Progress snapshots and cached iso strings are replaced, never mutated,
+            # so identity means "unchanged" (no field-by-field dataclass __eq__)
+            key = (task.progress, task.title, task._started_iso, task._completed_iso)
+            cached = old_cache.get(task.id)
+            if cached is not None and all(map(operator.is_, cached[0], key)):
+                data = cached[1]
+            else:
+                data = task.to_dict()
+            new_cache[task.id] = (key, data)
+            queue.append(data)
+        # Rebuilt each call, so removed tasks drop out of the cache
+        self._dict_cache = new_cache
+        return queue
+
+    def get_queue_bytes(self) -> bytes:
+        """Get the queue as a serialized JSON document ({"downloads": [...], "count": n})."""
+        queue = self.get_queue()
+        return orjson.dumps({"downloads": queue, "count": len(queue)})
 
     def cancel_download(self, task_id: str) -> bool:
         """Cancel a download by ID."""
-        task = self._tasks.get(task_id)
+        task = self.get_task(task_id)
         if not task:
             return False
 
-        if task.downloader:
-            task.downloader.cancel()
+        downloader = task.downloader  # cleared by the worker when it finishes
+        if downloader:
+            # Publishes the CANCELLED snapshot through the task's progress callback
+            downloader.cancel()
             return True
 
         if task.progress.status == DownloadStatus.PENDING:
-            task.progress.status = DownloadStatus.CANCELLED
+            task.progress = replace(task.progress, status=DownloadStatus.CANCELLED)
+            self._update_active(task_id, DownloadStatus.CANCELLED)
+            self._touch()
             return True
 
         return False
 
     def remove_task(self, task_id: str) -> bool:
         """Remove a completed/cancelled task."""
-        task = self._tasks.get(task_id)
-        if not task:
-            return False
+        lock, tasks = self._shard(task_id)
+        with lock:
+            task = tasks.get(task_id)
+            if not task or task.progress.status not in _FINISHED_STATUSES:
+                return False
+            del tasks[task_id]
 
-        if task.progress.status in (
-            DownloadStatus.COMPLETED,
-            DownloadStatus.ERROR,
-            DownloadStatus.CANCELLED,
-        ):
-            del self._tasks[task_id]
-            return True
-
-        return False
+        self._touch()
+        return True
 
     def clear_completed(self):
         """Remove all completed, errored, or cancelled tasks."""
-        to_remove = [
-            task_id
-            for task_id, task in self._tasks.items()
-            if task.progress.status in (
-                DownloadStatus.COMPLETED,
-                DownloadStatus.ERROR,
-                DownloadStatus.CANCELLED,
-            )
-        ]
-        for task_id in to_remove:
-            del self._tasks[task_id]
+        removed = 0
+        for lock, tasks in self._shards:
+            with lock:
+                kept = {
+                    task_id: task
+                    for task_id, task in tasks.items()
+                    if task.progress.status not in _FINISHED_STATUSES
+                }
+                if len(kept) != len(tasks):
+                    removed += len(tasks) - len(kept)
+                    # Refill in place: other threads hold references to this dict
+                    tasks.clear()
+                    tasks.update(kept)
+        if removed:
+            self._touch()
 
     def shutdown(self):
         """Shutdown the download manager."""
-        for task in self._tasks.values():
-            if task.downloader and task.progress.status == DownloadStatus.DOWNLOADING:
-                task.downloader.cancel()
+        for task in self._iter_tasks():
+            downloader = task.downloader
+            if downloader and task.progress.status == DownloadStatus.DOWNLOADING:
+                downloader.cancel()
         self._executor.shutdown(wait=False)
+        self._events.put_nowait(None)
+
+
+# Shared instance used by the server
+manager = DownloadManager()
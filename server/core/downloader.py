@@ -1,17 +1,39 @@
 """
 yt-dlp wrapper with progress callbacks.
 """
+import asyncio
+import base64
+import contextlib
+import http.cookiejar
+import itertools
+import json
 import logging
+import re
+import struct
 import subprocess
+import sys
+import threading
+import time
+import requests
 import yt_dlp
+from collections import deque
 from pathlib import Path
 from typing import Callable, Optional
-from dataclasses import dataclass, field
+from urllib.parse import urlparse
+from dataclasses import dataclass, field, replace
 from enum import Enum
 import config
+from .hls_fetcher import HLS_FETCHER_AVAILABLE, HlsFetchFailed, HlsUnsupported, fetch_hls
 
 logger = logging.getLogger('video_downloader.downloader')
 
+# SmartPlayer quality suffix (_720p, _480p, ...) at the end of the URL path
+_SP_MP4_RE = re.compile(r'_(\d+p)\.mp4$')
+_SP_M3U8_RE = re.compile(r'_(\d+p)\.m3u8$')
+
+# Minimum seconds between forwarded "downloading" progress updates (~10 Hz)
+PROGRESS_MIN_INTERVAL = 0.1
+
 
 def is_smartplayer_url(url: str) -> bool:
     """Check if URL is from SmartPlayer/ScaleUp (requires special audio handling)."""
@@ -28,17 +50,122 @@ def get_smartplayer_audio_url(video_url: str) -> str:
 
     We replace the quality suffix with the audio suffix.
     """
-    import re
-    # Pattern: match _XXXp or _XXX before .mp4 at the end
-    pattern = r'_(\d+p)\.mp4'
-    audio_url = re.sub(pattern, '_en_192k.mp4', video_url)
+    # Only the path carries the quality suffix; keep any query string as-is
+    path, sep, query = video_url.partition('?')
+    if path.endswith('.mp4'):
+        path = _SP_MP4_RE.sub('_en_192k.mp4', path)
+    elif path.endswith('.m3u8'):
+        path = _SP_M3U8_RE.sub('_en_192k.m3u8', path)
+    else:
+        return video_url
+    return path + sep + query
+
+
+def _tail_reader(stream) -> tuple[deque, threading.Thread]:
+    """Drain a pipe in a background thread, keeping only its last lines."""
+    tail: deque = deque(maxlen=256)
+    reader = threading.Thread(target=tail.extend, args=(stream,), daemon=True)
+    reader.start()
+    return tail, reader
+
+
+# MP3 encodes allowed at once; a download needing one past the limit waits
+# here for a free slot. Stream-copy remuxes are cheap and skip the limit.
+_FFMPEG_SLOTS = threading.BoundedSemaphore(config.FFMPEG_WORKERS)
+
+
+def _run_ffmpeg(cmd: list[str], timeout: float, encode: bool = True) -> subprocess.CompletedProcess:
+    """Run ffmpeg keeping only the tail of its stderr (for error reporting).
 
-    # Also handle m3u8 if needed
-    if audio_url == video_url:
-        pattern = r'_(\d+p)\.m3u8'
-        audio_url = re.sub(pattern, '_en_192k.m3u8', video_url)
+    encode=False marks a stream copy (-c copy), which doesn't take an encode slot.
+    """
+    with _FFMPEG_SLOTS if encode else contextlib.nullcontext():
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        tail, reader = _tail_reader(proc.stderr)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            reader.join()
+            proc.stderr.close()
+    stderr = b"".join(tail).decode("utf-8", errors="replace")
+    return subprocess.CompletedProcess(cmd, returncode, stderr=stderr)
+
+
+def _mp4_moov_first(head: bytes) -> bool:
+    """Whether an mp4's top-level moov box comes before mdat, judging from its first bytes.
+
+    ffmpeg can only decode an mp4 from a pipe when the index (moov) arrives
+    first ("faststart"). Returns False when undecidable from `head`.
+    """
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box = struct.unpack_from(">I4s", head, offset)
+        if box == b"moov":
+            return True
+        if box == b"mdat":
+            return False
+        if size == 1:  # 64-bit size follows the type
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack_from(">Q", head, offset + 8)[0]
+        if size < 8:  # 0 = box runs to end of file; anything else is malformed
+            return False
+        offset += size
+    return False
 
-    return audio_url
+
+# Characters not allowed in file names on Windows (the strictest target)
+_UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def _safe_filename(name: str, limit: int = 150) -> str:
+    """Make a title usable as a file name stem."""
+    return _UNSAFE_FILENAME_RE.sub("_", name).strip(" .")[:limit]
+
+
+def _cloudflare_video_id(url: str) -> Optional[str]:
+    """Video ID of a Cloudflare Stream manifest URL (/<id or JWT>/manifest/...).
+
+    Signed URLs carry a JWT instead of the ID; its "sub" claim holds the ID.
+    """
+    parsed = urlparse(url)
+    if not (parsed.hostname or "").endswith("cloudflarestream.com"):
+        return None
+    token = parsed.path.lstrip("/").partition("/")[0]
+    if token.count(".") != 2:
+        return token or None
+    payload = token.split(".")[1]
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except ValueError:
+        return None
+    sub = claims.get("sub") if isinstance(claims, dict) else None
+    return sub if isinstance(sub, str) and sub else None
+
+
+def _cookie_domain_matches(cookie: http.cookiejar.Cookie, host: str) -> bool:
+    """Whether a cookie applies to a host: exact match, or a subdomain on a dot boundary."""
+    domain = cookie.domain.lstrip(".").lower()
+    if host == domain:
+        return True
+    if "." not in domain:
+        return False  # TLD-wide cookie (".la"): never sent to other hosts
+    # Host-only cookies (no leading dot / include-subdomains FALSE) stop here
+    return (cookie.domain_specified or cookie.domain.startswith(".")) and host.endswith("." + domain)
+
+
+def _ffmpeg_executable() -> Path:
+    exe_suffix = ".exe" if sys.platform == "win32" else ""
+    return Path(config.FFMPEG_LOCATION) / f"ffmpeg{exe_suffix}"
+
+
+def _format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
 
 
 class DownloadStatus(Enum):
@@ -50,8 +177,10 @@ class DownloadStatus(Enum):
     CANCELLED = "cancelled"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DownloadProgress:
+    """Immutable progress snapshot; updates publish a new instance."""
+
     status: DownloadStatus = DownloadStatus.PENDING
     progress: float = 0.0
     speed: str = ""
@@ -83,8 +212,10 @@ class Downloader:
         cookies: Optional[dict] = None,
         cookie_file: Optional[str] = None,
         audio_only: bool = False,
+        title: str = "",
     ):
         self.url = url
+        self.title = title  # Used to name files yt-dlp doesn't name (HLS fetcher, MP3 stream)
         self.output_dir = output_dir or config.DOWNLOAD_DIR
         self.format_id = format_id
         self.cookies = cookies
@@ -93,6 +224,8 @@ class Downloader:
         self.progress = DownloadProgress()
         self._cancelled = False
         self._progress_callback: Optional[Callable[[DownloadProgress], None]] = None
+        self._last_emit = 0.0
+        self._last_status: Optional[DownloadStatus] = None
 
     def set_progress_callback(self, callback: Callable[[DownloadProgress], None]):
         """Set callback function for progress updates."""
@@ -101,7 +234,19 @@ class Downloader:
     def cancel(self):
         """Cancel the download."""
         self._cancelled = True
-        self.progress.status = DownloadStatus.CANCELLED
+        # Snapshots are immutable: publish the cancel, or holders keep the old status
+        self._update(status=DownloadStatus.CANCELLED)
+        self._emit()
+
+    def _update(self, **changes) -> DownloadProgress:
+        """Publish a new progress snapshot with the given fields changed."""
+        self.progress = replace(self.progress, **changes)
+        return self.progress
+
+    def _emit(self):
+        """Send the current progress snapshot to the callback."""
+        if self._progress_callback:
+            self._progress_callback(self.progress)
 
     def _progress_hook(self, d: dict):
         """Hook called by yt-dlp during download."""
@@ -109,38 +254,52 @@ class Downloader:
             raise Exception("Download cancelled")
 
         status = d.get("status", "")
+        now = time.monotonic()
 
         if status == "downloading":
-            self.progress.status = DownloadStatus.DOWNLOADING
-            self.progress.filename = d.get("filename", "")
-            self.progress.total_bytes = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
-            self.progress.downloaded_bytes = d.get("downloaded_bytes", 0)
-            self.progress.speed = d.get("_speed_str", "")
-            self.progress.eta = d.get("_eta_str", "")
-
-            if self.progress.total_bytes > 0:
-                self.progress.progress = (
-                    self.progress.downloaded_bytes / self.progress.total_bytes * 100
-                )
-
+            total_bytes = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+            downloaded_bytes = d.get("downloaded_bytes", 0)
+            if total_bytes > 0:
+                percent = downloaded_bytes / total_bytes * 100
+            else:
+                percent = self.progress.progress
+
+            # Throttle chunk-level updates; status changes and 100% always go through
+            if (
+                self._last_status == DownloadStatus.DOWNLOADING
+                and percent < 100.0
+                and now - self._last_emit < PROGRESS_MIN_INTERVAL
+            ):
+                return
+
+            self._update(
+                status=DownloadStatus.DOWNLOADING,
+                progress=percent,
+                speed=d.get("_speed_str", ""),
+                eta=d.get("_eta_str", ""),
+                filename=d.get("filename", ""),
+                total_bytes=total_bytes,
+                downloaded_bytes=downloaded_bytes,
+            )
         elif status == "finished":
-            self.progress.status = DownloadStatus.PROCESSING
-            self.progress.progress = 100.0
+            self._update(status=DownloadStatus.PROCESSING, progress=100.0)
 
-        if self._progress_callback:
-            self._progress_callback(self.progress)
+        self._last_emit = now
+        self._last_status = self.progress.status
+        self._emit()
 
     def _postprocessor_hook(self, d: dict):
         """Hook called by yt-dlp during post-processing."""
+        if self._cancelled:
+            raise Exception("Download cancelled")
+
         status = d.get("status")
         if status == "started":
-            self.progress.status = DownloadStatus.PROCESSING
-            if self._progress_callback:
-                self._progress_callback(self.progress)
+            self._update(status=DownloadStatus.PROCESSING)
+            self._emit()
         elif status == "finished":
             # Post-processing finished - notify UI
-            if self._progress_callback:
-                self._progress_callback(self.progress)
+            self._emit()
 
     def get_info(self) -> dict:
         """Get video info without downloading."""
@@ -162,16 +321,16 @@ class Downloader:
             logger.error("  FFmpeg not available for MP3 conversion")
             return None
 
-        import sys
         mp3_path = video_path.with_suffix(".mp3")
-        exe_suffix = ".exe" if sys.platform == "win32" else ""
-        ffmpeg_path = Path(config.FFMPEG_LOCATION) / f"ffmpeg{exe_suffix}"
+        ffmpeg_path = _ffmpeg_executable()
 
         logger.info(f"  Converting to MP3: {video_path.name} -> {mp3_path.name}")
 
         try:
             cmd = [
                 str(ffmpeg_path),
+                "-nostdin",
+                "-hide_banner",
                 "-i", str(video_path),
                 "-vn",  # No video
                 "-acodec", "libmp3lame",
@@ -181,12 +340,7 @@ class Downloader:
             ]
             logger.info(f"  FFmpeg command: {' '.join(cmd)}")
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
+            result = _run_ffmpeg(cmd, timeout=300)  # 5 minute timeout
 
             if result.returncode == 0 and mp3_path.exists():
                 logger.info(f"  MP3 conversion successful: {mp3_path.name}")
@@ -205,6 +359,202 @@ class Downloader:
             logger.error(f"  FFmpeg conversion failed: {e}")
             return None
 
+    def _stream_to_mp3(self, audio_url: str) -> Optional[DownloadResult]:
+        """Pipe a SmartPlayer audio stream straight from HTTP into ffmpeg.
+
+        The intermediate mp4 never touches disk. Returns None when ffmpeg
+        cannot encode from a pipe, so the caller can fall back to
+        download-then-convert. A moov atom at the end of the file is detected
+        from the first chunk, before any more of the body is read.
+        """
+        mp3_path = self._unique_path(self._output_stem(audio_url, "audio"), ".mp3")
+        cmd = [
+            str(_ffmpeg_executable()),
+            "-hide_banner",
+            "-i", "pipe:0",
+            "-vn",
+            "-acodec", "libmp3lame",
+            "-ab", "192k",
+            "-f", "mp3",
+            "-y",
+            str(mp3_path),
+        ]
+        logger.info(f"  Streaming audio into ffmpeg: {mp3_path.name}")
+
+        # Encoding while downloading still counts against the encode limit; take
+        # the slot before the request so the response isn't left idle waiting for it
+        with _FFMPEG_SLOTS:
+            with requests.get(
+                audio_url, stream=True, cookies=self._cookies_for(audio_url), timeout=30
+            ) as response:
+                response.raise_for_status()
+                chunks = response.iter_content(chunk_size=256 * 1024)
+                head = next(chunks, b"")
+                if not _mp4_moov_first(head):
+                    # ffmpeg would only fail after the whole body went through the pipe
+                    logger.info("  moov atom not at the start of the mp4, not streaming")
+                    return None
+
+                total = int(response.headers.get("Content-Length") or 0)
+                started = time.monotonic()
+                received = 0
+                proc = subprocess.Popen(
+                    cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+                )
+                tail, reader = _tail_reader(proc.stderr)
+                try:
+                    try:
+                        for chunk in itertools.chain((head,), chunks):
+                            proc.stdin.write(chunk)
+                            received += len(chunk)
+                            elapsed = time.monotonic() - started or 1e-6
+                            speed = received / elapsed
+                            self._progress_hook({
+                                "status": "downloading",
+                                "filename": mp3_path.name,
+                                "downloaded_bytes": received,
+                                "total_bytes": total,
+                                "_speed_str": f"{speed / 1048576:.2f}MiB/s",
+                                "_eta_str": _format_eta((total - received) / speed) if total else "",
+                            })
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        # ffmpeg gave up early; its exit code decides below
+                        try:
+                            proc.stdin.close()
+                        except BrokenPipeError:
+                            pass
+                    returncode = proc.wait(timeout=300)
+                except BaseException:
+                    proc.kill()
+                    proc.wait()
+                    mp3_path.unlink(missing_ok=True)
+                    raise
+                finally:
+                    reader.join()
+                    proc.stderr.close()
+
+        if returncode != 0:
+            stderr = b"".join(tail).decode("utf-8", errors="replace")
+            logger.warning(f"  Streaming conversion failed, falling back: {stderr[-500:]}")
+            mp3_path.unlink(missing_ok=True)
+            return None
+
+        self._update(status=DownloadStatus.COMPLETED, progress=100.0, filename=mp3_path.name)
+        self._emit()
+        return DownloadResult(
+            success=True,
+            filename=mp3_path.name,
+            filepath=str(mp3_path),
+        )
+
+    def _output_stem(self, url: str, default: str) -> str:
+        """File name stem for a download yt-dlp doesn't name: title, video ID, then URL."""
+        stem = _safe_filename(self.title) or _cloudflare_video_id(url)
+        return stem or Path(urlparse(url).path).stem or default
+
+    def _unique_path(self, stem: str, suffix: str) -> Path:
+        """Path in the output dir that doesn't exist yet ("name (1).mp4", ...)."""
+        path = self.output_dir / f"{stem}{suffix}"
+        counter = 1
+        while path.exists():
+            path = self.output_dir / f"{stem} ({counter}){suffix}"
+            counter += 1
+        return path
+
+    def _cookies_for(self, url: str) -> Optional[dict]:
+        """Cookies (from dict or Netscape cookie file) that apply to a URL's host."""
+        if self.cookies:
+            return self.cookies
+        if not self.cookie_file:
+            return None
+
+        jar = http.cookiejar.MozillaCookieJar(self.cookie_file)
+        try:
+            jar.load(ignore_discard=True, ignore_expires=True)
+        except (OSError, http.cookiejar.LoadError):
+            return None
+        host = urlparse(url).hostname or ""
+        return {c.name: c.value for c in jar if _cookie_domain_matches(c, host)}
+
+    def _download_hls(self, url: str) -> Optional[DownloadResult]:
+        """Download an HLS stream with the parallel fetcher.
+
+        Returns None when the playlist is not supported or a request fails,
+        so the caller can fall back to yt-dlp.
+        """
+        out_path = self._unique_path(self._output_stem(url, "video"), ".mp4")
+
+        started = time.monotonic()
+        received = 0
+
+        def on_progress(done: int, total: int, nbytes: int):
+            nonlocal received
+            received += nbytes
+            elapsed = time.monotonic() - started or 1e-6
+            # Reuse the yt-dlp hook for cancellation and debouncing
+            self._progress_hook({
+                "status": "downloading",
+                "filename": out_path.name,
+                "downloaded_bytes": received,
+                "total_bytes_estimate": int(received / done * total),
+                "_speed_str": f"{received / elapsed / 1048576:.2f}MiB/s",
+                "_eta_str": _format_eta(elapsed / done * (total - done)),
+            })
+
+        try:
+            tracks = asyncio.run(fetch_hls(
+                url,
+                out_path,
+                cookies=self._cookies_for(url),
+                concurrency=config.HLS_CONCURRENCY,
+                on_progress=on_progress,
+                allow_separate_audio=config.FFMPEG_AVAILABLE,
+            ))
+        except HlsUnsupported as e:
+            logger.info(f"  HLS fetcher skipped ({e}), falling back to yt-dlp")
+            return None
+        except HlsFetchFailed as e:
+            logger.warning(f"  HLS fetcher failed ({e}), falling back to yt-dlp")
+            return None
+
+        if not config.FFMPEG_AVAILABLE:
+            # Single track, no remux possible: keep the raw container
+            out_path = out_path.with_suffix(tracks[0].suffix)
+            tracks[0].replace(out_path)
+        else:
+            self._update(status=DownloadStatus.PROCESSING, progress=100.0)
+            self._emit()
+
+            cmd = [str(_ffmpeg_executable()), "-nostdin", "-hide_banner"]
+            for track in tracks:
+                cmd += ["-i", str(track)]
+            for index in range(len(tracks)):
+                cmd += ["-map", str(index)]
+            cmd += ["-c", "copy", "-y", str(out_path)]
+
+            try:
+                result = _run_ffmpeg(cmd, timeout=300, encode=False)
+                if result.returncode != 0:
+                    raise RuntimeError(f"FFmpeg remux failed: {result.stderr[-500:]}")
+            except BaseException:
+                out_path.unlink(missing_ok=True)
+                raise
+            finally:
+                for track in tracks:
+                    track.unlink(missing_ok=True)
+
+        self._update(
+            status=DownloadStatus.COMPLETED, progress=100.0, filename=out_path.name
+        )
+        self._emit()
+
+        return DownloadResult(
+            success=True,
+            filename=out_path.name,
+            filepath=str(out_path),
+        )
+
     def download(self) -> DownloadResult:
         """Execute the download and return result."""
         download_url = self.url
@@ -240,6 +590,7 @@ class Downloader:
             "outtmpl": str(self.output_dir / "%(title)s.%(ext)s"),
             "progress_hooks": [self._progress_hook],
             "postprocessor_hooks": [self._postprocessor_hook],
+            "concurrent_fragment_downloads": config.CONCURRENT_FRAGMENT_DOWNLOADS,
         }
 
         if self.format_id and not self.audio_only:
@@ -250,7 +601,29 @@ class Downloader:
             ydl_opts["cookiefile"] = self.cookie_file
 
         try:
-            self.progress.status = DownloadStatus.DOWNLOADING
+            self._update(status=DownloadStatus.DOWNLOADING)
+
+            # Plain HLS video: fetch segments in parallel instead of through yt-dlp
+            if (
+                HLS_FETCHER_AVAILABLE
+                and not self.audio_only
+                and not self.format_id
+                and urlparse(download_url).path.endswith(".m3u8")
+            ):
+                result = self._download_hls(download_url)
+                if result is not None:
+                    return result
+
+            # SmartPlayer MP3: encode while downloading instead of converting afterwards
+            if (
+                use_manual_mp3_conversion
+                and config.FFMPEG_AVAILABLE
+                and urlparse(download_url).path.endswith(".mp4")
+            ):
+                result = self._stream_to_mp3(download_url)
+                if result is not None:
+                    return result
+
             logger.info("  Calling yt-dlp extract_info...")
 
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -280,9 +653,8 @@ class Downloader:
 
                 # SmartPlayer: convert downloaded video to MP3
                 if use_manual_mp3_conversion and filepath.exists():
-                    self.progress.status = DownloadStatus.PROCESSING
-                    if self._progress_callback:
-                        self._progress_callback(self.progress)
+                    self._update(status=DownloadStatus.PROCESSING)
+                    self._emit()
 
                     mp3_path = self._convert_to_mp3(filepath)
                     if mp3_path:
@@ -290,21 +662,17 @@ class Downloader:
                     else:
                         # Notify error via callback before returning
                         error_msg = "Failed to convert to MP3"
-                        self.progress.status = DownloadStatus.ERROR
-                        self.progress.error = error_msg
-                        if self._progress_callback:
-                            self._progress_callback(self.progress)
+                        self._update(status=DownloadStatus.ERROR, error=error_msg)
+                        self._emit()
                         return DownloadResult(
                             success=False,
                             error=error_msg
                         )
 
-                self.progress.status = DownloadStatus.COMPLETED
-                self.progress.progress = 100.0
-                self.progress.filename = filepath.name
-
-                if self._progress_callback:
-                    self._progress_callback(self.progress)
+                self._update(
+                    status=DownloadStatus.COMPLETED, progress=100.0, filename=filepath.name
+                )
+                self._emit()
 
                 return DownloadResult(
                     success=True,
@@ -318,11 +686,10 @@ class Downloader:
             error_msg = str(e)
             logger.error(f"  Download failed: {error_msg}")
             logger.exception("  Full exception:")
-            self.progress.status = DownloadStatus.ERROR
-            self.progress.error = error_msg
-
-            if self._progress_callback:
-                self._progress_callback(self.progress)
+            # A hook raising after cancel() must not turn the cancel into an error
+            if not self._cancelled:
+                self._update(status=DownloadStatus.ERROR, error=error_msg)
+                self._emit()
 
             return DownloadResult(
                 success=False,
@@ -1,13 +1,45 @@
 """
 Custom URL extractors for platforms not directly supported by yt-dlp.
 """
-from .hubla import HublaExtractor, get_extractor_for_url, needs_special_extraction, transform_url_if_needed
+from typing import Optional, Type
+from urllib.parse import urlparse
+
+from .hubla import HublaExtractor, needs_special_extraction, transform_url_if_needed
 from .base import BaseExtractor, ExtractorResult
 
+# Registered extractors, in priority order
+EXTRACTORS: list[Type[BaseExtractor]] = [HublaExtractor]
+
+# Hostname -> extractor, built once from the literal hostnames in URL_PATTERNS
+_HOST_TABLE: dict[str, Type[BaseExtractor]] = {}
+for _extractor in EXTRACTORS:
+    for _pattern in _extractor.URL_PATTERNS:
+        _HOST_TABLE.setdefault(_pattern.replace("\\.", ".").lower(), _extractor)
+del _extractor, _pattern
+
+
+def get_extractor_for_url(url: str) -> Optional[BaseExtractor]:
+    """
+    Get the appropriate extractor for a URL.
+
+    Args:
+        url: URL to find extractor for
+
+    Returns:
+        Extractor instance if one matches, None otherwise
+    """
+    host = urlparse(url).hostname or ""
+    for suffix, extractor_class in _HOST_TABLE.items():
+        if host == suffix or host.endswith("." + suffix):
+            return extractor_class()
+    return None
+
+
 __all__ = [
     "HublaExtractor",
     "BaseExtractor",
     "ExtractorResult",
+    "EXTRACTORS",
     "get_extractor_for_url",
     "needs_special_extraction",
     "transform_url_if_needed",
@@ -13,25 +13,86 @@ This extractor provides utilities to:
 """
 import re
 import logging
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 from urllib.parse import urlparse
 
 from .base import BaseExtractor, ExtractorResult
 
+# RE2 (linear-time DFA matching) for scanning large HTML/JSON payloads, when installed
+try:
+    import re2
+except ImportError:
+    re2 = None
+
 logger = logging.getLogger('video_downloader.extractor')
 
-# Platforms known to use special video players (Cloudflare Stream, SmartPlayer, etc)
-SPECIAL_PLAYER_PLATFORMS = [
-    r"hub\.la",
-    r"app\.hub\.la",
-    r"codigoviral\.com\.br",
-    r"cursos\.codigoviral\.com\.br",
-    r"hotmart\.com",
-    r"eduzz\.com",
-    r"kiwify\.com\.br",
-    r"monetizze\.com\.br",
-    r"areademembros\.com",
-]
+# Hostnames of platforms known to use special video players (Cloudflare Stream,
+# SmartPlayer, etc). Subdomains (app.hub.la, cursos.codigoviral.com.br, ...) match too.
+PLATFORM_HOSTS = (
+    "hub.la",
+    "codigoviral.com.br",
+    "hotmart.com",
+    "eduzz.com",
+    "kiwify.com.br",
+    "monetizze.com.br",
+    "areademembros.com",
+)
+
+# Same platforms as regex patterns (BaseExtractor.URL_PATTERNS format)
+SPECIAL_PLAYER_PLATFORMS = [re.escape(host) for host in PLATFORM_HOSTS]
+
+_PLATFORM_HOSTS = frozenset(PLATFORM_HOSTS)
+_PLATFORM_SUFFIXES = tuple("." + host for host in PLATFORM_HOSTS)
+
+
+def _is_platform_host(url: str) -> bool:
+    """Check if the URL's hostname is one of the course platforms (or a subdomain)."""
+    host = urlparse(url).hostname or ""
+    return host in _PLATFORM_HOSTS or host.endswith(_PLATFORM_SUFFIXES)
+
+
+# Cloudflare Stream URL pattern
+CLOUDFLARE_STREAM_PATTERN = r"https?://[^/]*cloudflarestream\.com/[^/]+/manifest/video\.m3u8"
+
+# SmartPlayer/ScaleUp URL patterns
+SMARTPLAYER_PATTERN = r"https?://stream\.smartplayer\.io/[a-f0-9]+/[a-f0-9]+/[^\"'\s]+\.(mp4|m3u8)"
+SCALEUP_PATTERN = r"https?://stream\.scaleup\.com\.br/player/v1/playlists/[^\"'\s]+\.m3u8"
+
+# Cloudflare Stream URLs with JWT tokens, embedded in HTML/JSON
+CLOUDFLARE_EXTRACT_PATTERN = r'https?://customer-[a-z0-9]+\.cloudflarestream\.com/[A-Za-z0-9_-]+/manifest/video\.m3u8'
+
+# Compiled once at import; URL classification runs on every download request
+_CLOUDFLARE_STREAM_RE = re.compile(CLOUDFLARE_STREAM_PATTERN, re.IGNORECASE)
+_SMARTPLAYER_RE = re.compile(SMARTPLAYER_PATTERN, re.IGNORECASE)
+_SCALEUP_RE = re.compile(SCALEUP_PATTERN, re.IGNORECASE)
+_CLOUDFLARE_EXTRACT_RE = (re2 or re).compile(CLOUDFLARE_EXTRACT_PATTERN)
+
+
+@dataclass(frozen=True, slots=True)
+class UrlClass:
+    """Result of all URL checks, computed once per URL."""
+    is_platform: bool
+    is_cf_stream: bool
+    is_smartplayer: bool
+
+    @property
+    def is_direct_stream(self) -> bool:
+        return self.is_cf_stream or self.is_smartplayer
+
+
+@lru_cache(maxsize=1024)
+def classify(url: str) -> UrlClass:
+    """Classify a URL (platform page, Cloudflare Stream, SmartPlayer)."""
+    return UrlClass(
+        is_platform=_is_platform_host(url),
+        is_cf_stream=_CLOUDFLARE_STREAM_RE.search(url) is not None,
+        is_smartplayer=(
+            _SMARTPLAYER_RE.search(url) is not None
+            or _SCALEUP_RE.search(url) is not None
+        ),
+    )
 
 
 class HublaExtractor(BaseExtractor):
@@ -40,12 +101,10 @@ class HublaExtractor(BaseExtractor):
     # URL patterns for platforms using special players
     URL_PATTERNS = SPECIAL_PLAYER_PLATFORMS
 
-    # Cloudflare Stream URL pattern
-    CLOUDFLARE_STREAM_PATTERN = r"https?://[^/]*cloudflarestream\.com/[^/]+/manifest/video\.m3u8"
-
-    # SmartPlayer/ScaleUp URL patterns
-    SMARTPLAYER_PATTERN = r"https?://stream\.smartplayer\.io/[a-f0-9]+/[a-f0-9]+/[^\"'\s]+\.(mp4|m3u8)"
-    SCALEUP_PATTERN = r"https?://stream\.scaleup\.com\.br/player/v1/playlists/[^\"'\s]+\.m3u8"
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
+        """Check if this extractor can handle the given URL (hostname match)."""
+        return classify(url).is_platform
 
     @classmethod
     def is_hubla_url(cls, url: str) -> bool:
@@ -60,18 +119,17 @@ class HublaExtractor(BaseExtractor):
     @classmethod
     def is_cloudflare_stream_url(cls, url: str) -> bool:
         """Check if URL is a Cloudflare Stream manifest."""
-        return bool(re.search(cls.CLOUDFLARE_STREAM_PATTERN, url, re.IGNORECASE))
+        return classify(url).is_cf_stream
 
     @classmethod
     def is_smartplayer_url(cls, url: str) -> bool:
         """Check if URL is a SmartPlayer/ScaleUp stream."""
-        return bool(re.search(cls.SMARTPLAYER_PATTERN, url, re.IGNORECASE)) or \
-               bool(re.search(cls.SCALEUP_PATTERN, url, re.IGNORECASE))
+        return classify(url).is_smartplayer
 
     @classmethod
     def is_direct_stream_url(cls, url: str) -> bool:
         """Check if URL is a direct stream URL (Cloudflare or SmartPlayer)."""
-        return cls.is_cloudflare_stream_url(url) or cls.is_smartplayer_url(url)
+        return classify(url).is_direct_stream
 
     @classmethod
     def extract_cloudflare_url_from_text(cls, text: str) -> Optional[str]:
@@ -84,9 +142,7 @@ class HublaExtractor(BaseExtractor):
         Returns:
             Cloudflare Stream URL if found, None otherwise
         """
-        # Pattern to match Cloudflare Stream URLs with JWT tokens
-        pattern = r'https?://customer-[a-z0-9]+\.cloudflarestream\.com/[A-Za-z0-9_-]+/manifest/video\.m3u8'
-        match = re.search(pattern, text)
+        match = _CLOUDFLARE_EXTRACT_RE.search(text)
         return match.group(0) if match else None
 
     def extract(self, url: str, cookies: Optional[list] = None) -> ExtractorResult:
@@ -147,30 +203,12 @@ class HublaExtractor(BaseExtractor):
         )
 
 
-def get_extractor_for_url(url: str) -> Optional[BaseExtractor]:
-    """
-    Get the appropriate extractor for a URL.
-
-    Args:
-        url: URL to find extractor for
-
-    Returns:
-        Extractor instance if one matches, None otherwise
-    """
-    extractors = [HublaExtractor]
-
-    for extractor_class in extractors:
-        if extractor_class.can_handle(url):
-            return extractor_class()
-
-    return None
-
-
 def needs_special_extraction(url: str) -> bool:
     """Check if URL needs special extraction (not natively supported by yt-dlp)."""
     # Course platform page URLs need special handling
-    # Cloudflare Stream URLs themselves can be handled directly
-    if HublaExtractor.is_cloudflare_platform_url(url) and not HublaExtractor.is_cloudflare_stream_url(url):
+    # Cloudflare Stream URLs themselves can be handled directly (and are never
+    # on a platform host, so the hostname check alone is enough)
+    if classify(url).is_platform:
         logger.debug(f"URL needs special extraction: {url[:50]}...")
         return True
     return False
@@ -188,12 +226,12 @@ def transform_url_if_needed(url: str, extracted_video_url: Optional[str] = None)
         URL to use for download
     """
     # If we have an extracted video URL that's a direct stream, use it
-    if extracted_video_url and HublaExtractor.is_direct_stream_url(extracted_video_url):
+    if extracted_video_url and classify(extracted_video_url).is_direct_stream:
         logger.info(f"Using extracted stream URL: {extracted_video_url[:80]}...")
         return extracted_video_url
 
     # If URL is already a direct stream URL, use it directly
-    if HublaExtractor.is_direct_stream_url(url):
+    if classify(url).is_direct_stream:
         logger.info(f"URL is direct stream, using as-is: {url[:80]}...")
         return url
 
@@ -0,0 +1,206 @@
+"""
+Parallel HLS segment fetcher.
+
+yt-dlp walks an HLS playlist segment by segment; for VOD manifests
+(Cloudflare Stream) we can instead keep many segment requests in flight
+over one keep-alive session and write them to disk in playlist order.
+"""
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+
+from .buffer_pool import POOL
+
+try:
+    import aiohttp
+    import m3u8
+    HLS_FETCHER_AVAILABLE = True
+except ImportError:
+    HLS_FETCHER_AVAILABLE = False
+
+logger = logging.getLogger('video_downloader.hls_fetcher')
+
+# on_progress(segments_done, segments_total, bytes_received)
+ProgressCallback = Callable[[int, int, int], None]
+
+
+class HlsUnsupported(Exception):
+    """Playlist needs features this fetcher does not handle (live, encrypted, ...)."""
+
+
+class HlsFetchFailed(Exception):
+    """A playlist or segment request failed (HTTP error, network error, timeout)."""
+
+
+async def _load_playlist(session, url: str):
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return m3u8.loads(await response.text(), uri=url)
+
+
+async def _resolve_tracks(session, manifest_url: str, allow_separate_audio: bool) -> list:
+    """Return the media playlists to download: [video] or [video, audio]."""
+    playlist = await _load_playlist(session, manifest_url)
+    if not playlist.is_variant:
+        return [playlist]
+
+    variant = max(playlist.playlists, key=lambda p: p.stream_info.bandwidth or 0)
+    tracks = [await _load_playlist(session, variant.absolute_uri)]
+
+    audio_group = variant.stream_info.audio
+    if audio_group:
+        renditions = [
+            m for m in playlist.media
+            if m.type == "AUDIO" and m.group_id == audio_group and m.uri
+        ]
+        if renditions:
+            if not allow_separate_audio:
+                raise HlsUnsupported("separate audio rendition needs ffmpeg to merge")
+            audio = next((m for m in renditions if m.default == "YES"), renditions[0])
+            tracks.append(await _load_playlist(session, audio.absolute_uri))
+
+    return tracks
+
+
+def _map_key(init_section):
+    return None if init_section is None else (init_section.uri, init_section.byterange)
+
+
+def _check_supported(playlist):
+    if not playlist.is_endlist:
+        raise HlsUnsupported("live playlists are not supported")
+    if any(key and key.method not in (None, "NONE") for key in playlist.keys):
+        raise HlsUnsupported("encrypted segments are not supported")
+    if not playlist.segments:
+        raise HlsUnsupported("playlist has no segments")
+    # Segments are fetched whole and only the first EXT-X-MAP is written
+    if any(seg.byterange for seg in playlist.segments):
+        raise HlsUnsupported("byte-range segments are not supported")
+    init = _map_key(playlist.segments[0].init_section)
+    if init is not None and init[1]:
+        raise HlsUnsupported("byte-range init sections are not supported")
+    if any(_map_key(seg.init_section) != init for seg in playlist.segments):
+        raise HlsUnsupported("init section changes mid-playlist")
+
+
+async def fetch_hls(
+    manifest_url: str,
+    out_path: Path,
+    cookies: Optional[dict] = None,
+    concurrency: int = 32,
+    on_progress: Optional[ProgressCallback] = None,
+    allow_separate_audio: bool = True,
+) -> list[Path]:
+    """Download an HLS VOD stream, returning one file per track.
+
+    Tracks are written next to ``out_path`` as ``<stem>.track<N><ext>``;
+    the caller is responsible for remuxing/merging them. On any failure the
+    partial track files are removed; network/HTTP errors are raised as
+    HlsFetchFailed.
+    """
+    if not HLS_FETCHER_AVAILABLE:
+        raise HlsUnsupported("aiohttp/m3u8 are not installed")
+
+    paths: list[Path] = []
+    try:
+        return await _fetch_tracks(
+            manifest_url, out_path, paths, cookies, concurrency, on_progress, allow_separate_audio
+        )
+    except BaseException as e:
+        for path in paths:
+            path.unlink(missing_ok=True)
+        if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+            raise HlsFetchFailed(str(e) or type(e).__name__) from e
+        raise
+
+
+async def _fetch_tracks(
+    manifest_url: str,
+    out_path: Path,
+    paths: list[Path],
+    cookies: Optional[dict],
+    concurrency: int,
+    on_progress: Optional[ProgressCallback],
+    allow_separate_audio: bool,
+) -> list[Path]:
+    """Body of fetch_hls(); appends each track path to ``paths`` before writing it."""
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    async with aiohttp.ClientSession(connector=connector, cookies=cookies) as session:
+        tracks = await _resolve_tracks(session, manifest_url, allow_separate_audio)
+        for playlist in tracks:
+            _check_supported(playlist)
+
+        sem = asyncio.Semaphore(concurrency)
+        total = sum(len(p.segments) for p in tracks)
+        done = 0
+
+        async def get(uri: str) -> tuple[bytearray, int]:
+            """Read a segment into a pooled buffer; caller must release it."""
+            async with sem:
+                async with session.get(uri) as response:
+                    response.raise_for_status()
+                    buf = POOL.acquire(response.content_length or 0)
+                    size = 0
+                    try:
+                        async for chunk in response.content.iter_any():
+                            end = size + len(chunk)
+                            buf[size:end] = chunk  # grows the buffer if needed
+                            size = end
+                    except BaseException:
+                        POOL.release(buf)
+                        raise
+                    return buf, size
+
+        def write(f, buf: bytearray, size: int):
+            with memoryview(buf)[:size] as view:
+                f.write(view)
+            POOL.release(buf)
+
+        for number, playlist in enumerate(tracks):
+            init = getattr(playlist.segments[0], "init_section", None)
+            ext = ".mp4" if init else ".ts"
+            path = out_path.with_name(f"{out_path.stem}.track{number}{ext}")
+            paths.append(path)
+
+            with open(path, "wb") as f:
+                if init:
+                    write(f, *await get(init.absolute_uri))
+
+                # Segments finish out of order; buffer until the next index arrives.
+                # A segment starts only within `concurrency` of the next one to write,
+                # so a stalled segment can't make the rest pile up in memory.
+                pending: dict[int, tuple[bytearray, int]] = {}
+                next_index = 0
+                window = asyncio.Condition()
+
+                async def fetch(index: int, uri: str):
+                    nonlocal next_index, done
+                    async with window:
+                        await window.wait_for(lambda: index < next_index + concurrency)
+                    buf, size = await get(uri)
+                    pending[index] = (buf, size)
+                    if next_index in pending:
+                        while next_index in pending:
+                            write(f, *pending.pop(next_index))
+                            next_index += 1
+                        async with window:
+                            window.notify_all()
+                    done += 1
+                    if on_progress:
+                        on_progress(done, total, size)
+
+                tasks = [
+                    asyncio.ensure_future(fetch(i, seg.absolute_uri))
+                    for i, seg in enumerate(playlist.segments)
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    raise
+
+            logger.info(f"  HLS track {number}: {len(playlist.segments)} segments -> {path.name}")
+
+        return paths
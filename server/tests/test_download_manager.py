@@ -0,0 +1,57 @@
+"""
+DownloadManager tests (yt-dlp is replaced by a fake, no network access).
+"""
+import pytest
+
+pytest.importorskip("yt_dlp")
+pytest.importorskip("orjson")
+
+from core import downloader as downloader_module
+from core.download_manager import DownloadManager
+from core.downloader import DownloadStatus
+
+
+class _CancelAfterExtract:
+    """Fake YoutubeDL: reports a finished download, then the user cancels
+    while yt-dlp would be post-processing (no more progress hooks fire)."""
+
+    manager = None
+    task_id = None
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        hook = self.opts["progress_hooks"][0]
+        hook({"status": "downloading", "filename": "/tmp/Title.mp4",
+              "downloaded_bytes": 10, "total_bytes": 10})
+        hook({"status": "finished", "filename": "/tmp/Title.mp4"})
+        assert self.manager.cancel_download(self.task_id)
+        return {"title": "Title"}
+
+
+def test_cancel_after_extract_info_is_final(monkeypatch):
+    monkeypatch.setattr(downloader_module.yt_dlp, "YoutubeDL", _CancelAfterExtract)
+    manager = DownloadManager()
+    _CancelAfterExtract.manager = manager
+
+    # Run the task on this thread so the test sees its final state
+    submitted = []
+    monkeypatch.setattr(manager._executor, "submit", lambda fn, *args: submitted.append((fn, args)))
+    task_id = manager.add_download("https://example.com/video")
+    _CancelAfterExtract.task_id = task_id
+    fn, args = submitted.pop()
+    fn(*args)
+
+    task = manager.get_task(task_id)
+    assert task.progress.status == DownloadStatus.CANCELLED
+    assert manager.active_count == 0
+    assert manager.get_queue()[0]["status"] == "cancelled"
+    assert manager.remove_task(task_id)
+    manager.shutdown()
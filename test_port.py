@@ -1,46 +1,390 @@
 #!/usr/bin/env python3
-"""Test script to find process by port."""
+"""Test script to find process by port.
+
+Uses psutil when it is installed (pip install psutil); otherwise falls
+back to the per-platform lookups below.
+"""
+import atexit
+import itertools
+import logging
+import os
+import re
+import socket
+import struct
 import subprocess
 import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5050
+
+# Reused across calls; grown when a table doesn't fit in one read
+_proc_buf = bytearray(1 << 16)
+
+def read_proc_table(path):
+    """Read a /proc table with a single read() so the snapshot is coherent."""
+    global _proc_buf
+    while True:
+        with open(path, "rb", buffering=0) as f:
+            n = f.readinto(_proc_buf)
+        if n < len(_proc_buf):
+            return bytes(memoryview(_proc_buf)[:n])
+        # Buffer filled up: the table may be truncated, retry with twice the room
+        _proc_buf = bytearray(2 * len(_proc_buf))
+
+# sock_diag (netlink) constants, from linux/netlink.h, sock_diag.h and inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+TCP_LISTEN = 10
+_NLMSG_HDR = struct.Struct("=IHHII")         # len, type, flags, seq, pid
+_INET_DIAG_REQ = struct.Struct("=BBBBI48x")  # family, protocol, ext, pad, states, sockid
+_DIAG_SPORT = struct.Struct("!H")            # inet_diag_msg.id.idiag_sport (network order)
+_DIAG_INODE = struct.Struct("=I")            # inet_diag_msg.idiag_inode
+
+# One netlink socket for the life of the process; replies are matched by
+# sequence number, so only one request may be in flight at a time.
+_nl_sock = None
+_nl_lock = threading.Lock()
+_nl_seq = itertools.count(1)
+
+def _close_netlink():
+    global _nl_sock
+    if _nl_sock is not None:
+        _nl_sock.close()
+        _nl_sock = None
+
+atexit.register(_close_netlink)
+
+def listening_inodes_netlink(port):
+    """Ask the kernel (sock_diag) for the inodes of TCP listeners on a port."""
+    global _nl_sock
+    inodes = set()
+    with _nl_lock:
+        if _nl_sock is None:
+            _nl_sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC, NETLINK_SOCK_DIAG
+            )
+        sock = _nl_sock
+        try:
+            for family in (socket.AF_INET, socket.AF_INET6):
+                seq = next(_nl_seq)
+                request = _INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, 0, 0, 1 << TCP_LISTEN)
+                header = _NLMSG_HDR.pack(
+                    _NLMSG_HDR.size + len(request), SOCK_DIAG_BY_FAMILY,
+                    NLM_F_REQUEST | NLM_F_DUMP, seq, 0
+                )
+                sock.send(header + request)
+
+                done = False
+                while not done:
+                    data = sock.recv(1 << 16)
+                    offset = 0
+                    while offset < len(data):
+                        length, msg_type, _, msg_seq, _ = _NLMSG_HDR.unpack_from(data, offset)
+                        if msg_seq != seq:
+                            pass  # Leftover from an earlier, abandoned dump
+                        elif msg_type == NLMSG_DONE:
+                            done = True
+                            break
+                        elif msg_type == NLMSG_ERROR:
+                            raise OSError("sock_diag request failed")
+                        else:
+                            body = offset + _NLMSG_HDR.size
+                            if _DIAG_SPORT.unpack_from(data, body + 4)[0] == port:
+                                inodes.add(_DIAG_INODE.unpack_from(data, body + 68)[0])
+                        offset += (length + 3) & ~3  # NLMSG_ALIGN
+        except BaseException:
+            # Don't leave a half-read dump on the shared socket
+            _close_netlink()
+            raise
+    return inodes
+
+# ASCII hex digit -> value, for decoding the 4-digit ports in /proc/net/tcp
+_HEX = [0] * 256
+for _i, _c in enumerate(b"0123456789ABCDEF"):
+    _HEX[_c] = _HEX[bytes([_c]).lower()[0]] = _i
+del _i, _c
+
+def listening_sockets_proc(ports):
+    """Map inode -> port for TCP listeners on any of `ports`, via /proc/net/tcp[6]."""
+    # /proc/net/tcp[6] columns: sl local_address rem_address st ... inode
+    sockets = {}
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            lines = read_proc_table(table).splitlines()[1:]  # Skip header
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10 or fields[3] != b"0A":  # 0A = LISTEN
+                continue
+            # local_address is ADDR:PORT with PORT always 4 hex digits
+            h = fields[1][-4:]
+            local_port = (_HEX[h[0]] << 12) | (_HEX[h[1]] << 8) | (_HEX[h[2]] << 4) | _HEX[h[3]]
+            if local_port in ports:
+                sockets[int(fields[9])] = local_port
+    return sockets
+
+# (built at, inode -> PID); one /proc walk serves every lookup within the TTL
+_inode_index = (0.0, {})
+INODE_INDEX_TTL = 1.0
+
+def socket_inode_index(max_age=INODE_INDEX_TTL):
+    """Map every socket inode on the system to its owning PID (one /proc walk, cached)."""
+    global _inode_index
+    built_at, index = _inode_index
+    now = time.monotonic()
+    if now - built_at < max_age:
+        return index
+
+    index = {}
+    # scandir: d_type comes with getdents64, so is_dir() costs no extra stat()
+    with os.scandir("/proc") as procs:
+        for proc in procs:
+            if not proc.name[0].isdigit() or not proc.is_dir(follow_symlinks=False):
+                continue
+            pid = int(proc.name)
+            try:
+                with os.scandir(f"{proc.path}/fd") as fds:
+                    for fd in fds:
+                        try:
+                            link = os.readlink(fd.path)
+                        except OSError:
+                            continue
+                        if link.startswith("socket:["):
+                            index.setdefault(int(link[8:-1]), pid)
+            except OSError:
+                continue  # Process exited or belongs to another user
+    _inode_index = (now, index)
+    return index
+
+def resolve_socket_owners(inodes):
+    """Map each socket inode to its owning PID."""
+    if not inodes:
+        return {}
+    index = socket_inode_index()
+    if not inodes <= index.keys():
+        index = socket_inode_index(max_age=0)  # Sockets created since the cached walk
+    return {inode: index[inode] for inode in inodes if inode in index}
+
+def scan_ports(ports):
+    """Map each listening port in `ports` to its PID in a single pass (Linux)."""
+    sockets = listening_sockets_proc(ports)
+    owners = resolve_socket_owners(sockets.keys())
+    return {sockets[inode]: pid for inode, pid in owners.items()}
+
+def get_pid_by_port_linux(port):
+    """Find the PID listening on a port via sock_diag or /proc (no lsof)."""
+    try:
+        inodes = listening_inodes_netlink(port)
+    except OSError as e:
+        logger.debug("sock_diag unavailable (%s), reading /proc/net/tcp", e)
+        inodes = set(listening_sockets_proc({port}))
+    logger.debug("Listening socket inodes on port %d: %s", port, inodes)
+    owners = resolve_socket_owners(inodes)
+    if owners:
+        return next(iter(owners.values()))
+    if inodes:
+        # The socket exists but its /proc/<pid>/fd is unreadable; let ss try
+        return get_pid_by_port_ss(port)
+    return None
+
+_SS_PID_RE = re.compile(r"pid=(\d+)")
+
+def get_pid_by_port_ss(port):
+    """Find the PID listening on a port with ss (kernel-side filter, one row back)."""
+    try:
+        result = subprocess.run(
+            ["ss", "-Hlntp", f"sport = :{port}"],
+            capture_output=True, text=True, check=False
+        )
+    except FileNotFoundError:
+        logger.debug("ss not found, falling back to lsof")
+        result = subprocess.run(
+            ["lsof", "-ti", f"tcp:{port}", "-sTCP:LISTEN"],
+            capture_output=True, text=True, check=False
+        )
+        lines = result.stdout.split(None, 1)
+        return int(lines[0]) if lines else None
+    match = _SS_PID_RE.search(result.stdout)
+    return int(match.group(1)) if match else None
+
+def get_pid_by_port_windows(port):
+    """Find the PID listening on a port via iphlpapi GetExtendedTcpTable (no netstat)."""
+    import ctypes
+    from ctypes import wintypes
+
+    AF_INET = 2
+    TCP_TABLE_OWNER_PID_LISTENER = 3
+    MIB_TCP_STATE_LISTEN = 2
+    ERROR_INSUFFICIENT_BUFFER = 122
+
+    class MIB_TCPROW_OWNER_PID(ctypes.Structure):
+        _fields_ = [
+            ("dwState", wintypes.DWORD),
+            ("dwLocalAddr", wintypes.DWORD),
+            ("dwLocalPort", wintypes.DWORD),
+            ("dwRemoteAddr", wintypes.DWORD),
+            ("dwRemotePort", wintypes.DWORD),
+            ("dwOwningPid", wintypes.DWORD),
+        ]
+
+    get_table = ctypes.WinDLL("iphlpapi").GetExtendedTcpTable
+    size = wintypes.DWORD(0)
+    buf = None
+    # First call (size 0) reports the required length; the table can grow in between
+    result = get_table(None, ctypes.byref(size), False, AF_INET, TCP_TABLE_OWNER_PID_LISTENER, 0)
+    while result == ERROR_INSUFFICIENT_BUFFER:
+        buf = ctypes.create_string_buffer(size.value)
+        result = get_table(buf, ctypes.byref(size), False, AF_INET, TCP_TABLE_OWNER_PID_LISTENER, 0)
+    if result != 0 or buf is None:
+        raise OSError(f"GetExtendedTcpTable failed: {result}")
+
+    count = wintypes.DWORD.from_buffer(buf).value
+    rows = (MIB_TCPROW_OWNER_PID * count).from_buffer(buf, ctypes.sizeof(wintypes.DWORD))
+    for row in rows:
+        if row.dwState == MIB_TCP_STATE_LISTEN and socket.ntohs(row.dwLocalPort & 0xFFFF) == port:
+            return row.dwOwningPid
+    return None
+
+# port -> (pid, lookup time); repeated lookups within the TTL skip the scan
+_cache: dict[int, tuple[int, float]] = {}
+CACHE_TTL = 2.0
+
+def pid_exists(pid):
+    """Check that a process is still alive."""
+    if sys.platform == "win32":
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return True
+
+def get_pid_by_port(port=DEFAULT_PORT):
+    """Get the PID of the process using a specific port (cached for CACHE_TTL seconds).
+
+    Lookup steps are logged at DEBUG level on this module's logger.
+    """
+    cached = _cache.get(port)
+    if cached:
+        pid, ts = cached
+        if time.monotonic() - ts < CACHE_TTL and pid_exists(pid):
+            return pid
+        del _cache[port]
+
+    pid = lookup_pid_by_port(port)
+    if pid:
+        _cache[port] = (pid, time.monotonic())
+    return pid
+
+def _netstat_needles(port):
+    # netstat output is ASCII: scan the raw bytes, no decode pass.
+    # Localized netstat translates "LISTENING"; listeners still have a :0 foreign port.
+    return (
+        b":%d " % port,
+        re.compile(rb":%d\s+(?:0\.0\.0\.0|\[::\]):0\s+\S+\s+(\d+)" % port),
+    )
+
+_DEFAULT_NEEDLE, _DEFAULT_LOCALIZED = _netstat_needles(DEFAULT_PORT)
+
+def _scan_netstat(lines, _needle=_DEFAULT_NEEDLE, _localized=_DEFAULT_LOCALIZED,
+                  _listen=b"LISTENING"):
+    """Return the PID from the first listening netstat row for the needle's port.
+
+    The needles are bound as defaults so the loop reads them as locals.
+    """
+    for line in lines:
+        # Find the port once, then look for the state only past it
+        idx = line.find(_needle)
+        if idx < 0:
+            continue
+        if line.find(_listen, idx) >= 0:
+            pid = int(line.rsplit(None, 1)[1])
+        else:
+            match = _localized.search(line, idx)
+            if not match:
+                continue
+            pid = int(match.group(1))
+        logger.debug("Found line: %s", line.strip())
+        return pid
+    return None
+
+def get_pid_by_port_psutil(port):
+    """Find the PID listening on a port with psutil (native kernel APIs, no subprocess)."""
+    for conn in psutil.net_connections(kind="tcp"):
+        if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
+            return conn.pid
+    return None
+
+def lookup_pid_by_port(port):
+    """Find the PID using a port, without the cache."""
+    if psutil is not None:
+        try:
+            return get_pid_by_port_psutil(port)
+        except psutil.AccessDenied:
+            logger.debug("psutil: access denied, falling back to platform lookup")
 
-def get_pid_by_port(port=5050):
-    """Get the PID of the process using a specific port."""
     try:
         if sys.platform == "win32":
-            # On Windows, use netstat to find the process
-            result = subprocess.run(
+            try:
+                return get_pid_by_port_windows(port)
+            except OSError as e:
+                logger.debug("%s, falling back to netstat", e)
+
+            # Fallback: stream netstat and stop at the first LISTENING match
+            logger.debug("Looking for port %d in netstat output", port)
+            with subprocess.Popen(
                 ["netstat", "-ano", "-p", "TCP"],
-                capture_output=True, text=True, check=False
-            )
-            print("=== NETSTAT OUTPUT ===")
-            print(result.stdout)
-            print("=== END NETSTAT ===")
-
-            print(f"\n=== Looking for port {port} ===")
-            for line in result.stdout.split('\n'):
-                if f":{port}" in line:
-                    print(f"Found line: {line}")
-                    if "LISTENING" in line:
-                        parts = line.split()
-                        print(f"Parts: {parts}")
-                        if parts:
-                            pid = int(parts[-1])
-                            print(f"Found PID: {pid}")
-                            return pid
+                stdout=subprocess.PIPE, bufsize=1 << 16
+            ) as proc:
+                if port == DEFAULT_PORT:
+                    pid = _scan_netstat(proc.stdout)
+                else:
+                    pid = _scan_netstat(proc.stdout, *_netstat_needles(port))
+                if pid is not None:
+                    proc.terminate()
+                    return pid
+        elif sys.platform.startswith("linux"):
+            return get_pid_by_port_linux(port)
         else:
-            # On Unix, use lsof
-            result = subprocess.run(
-                ["lsof", "-ti", f":{port}"],
-                capture_output=True, text=True, check=False
-            )
-            if result.stdout.strip():
-                return int(result.stdout.strip().split('\n')[0])
+            # On macOS, use lsof; take the first listener's PID and stop it there
+            with subprocess.Popen(
+                ["lsof", "-ti", f"tcp:{port}", "-sTCP:LISTEN"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            ) as proc:
+                line = proc.stdout.readline()
+                proc.terminate()
+            if line.strip():
+                return int(line)
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
     return None
 
 if __name__ == "__main__":
-    port = 5050
+    port = DEFAULT_PORT
+    # -v: show the lookup steps; otherwise no debug messages are formatted at all
+    if "-v" in sys.argv[1:]:
+        logging.basicConfig(level=logging.DEBUG, format="%(message)s")
     print(f"Searching for process on port {port}...")
     pid = get_pid_by_port(port)
     if pid: